@@ -1,31 +1,130 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
-import sqlite3
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, g, Response, stream_with_context, abort
+from flask import before_render_template, template_rendered
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+import hashlib
 import os
-from datetime import datetime
-import bcrypt # type: ignore
+import re
+import sys
+import time
+from datetime import datetime, timedelta
 from functools import wraps
 
+import archive
+import metrics
+import replica
+from cache import TTLCache
+from datas import datahora_br, de_epoch, para_epoch
+from db import DATABASE, data_version, pool
+from eventos import TooManySubscribers, broker
+from export import EXPORT_FORMATS, EXPORT_SELECT
+from placas import placa_chave
+from reports import FILTROS as RELATORIO_FILTROS, DIAS_SEMANA, RELATORIO_MAX_DIAS, obter_relatorio, relatorio_cache
+from passwords import (HashingBusy, hash_password_bcrypt, hashing_pool, needs_rehash,
+                       rehash_in_background, verify_password)
+from setup_database_bcrypt import run_migrations, reconcile_dashboard_counters
+from writer import writer
+
 app = Flask(__name__)
 app.secret_key = os.environ.get("SECRET_KEY", "portaria_secret_key_2024_change_in_production")
 
-DATABASE = "portaria.db"
+PERMISSION_CACHE_TTL = float(os.environ.get("PERMISSION_CACHE_TTL", "60"))
+permission_cache = TTLCache(maxsize=512, ttl=PERMISSION_CACHE_TTL, name="permissoes")
+
+FRAGMENT_CACHE_TTL = float(os.environ.get("FRAGMENT_CACHE_TTL", "3600"))
+fragment_cache = TTLCache(maxsize=1024, ttl=FRAGMENT_CACHE_TTL, name="fragmentos")
+
+# Templates compilados ficam em disco: um worker novo não recompila nada
+JINJA_CACHE_DIR = os.environ.get("JINJA_CACHE_DIR", os.path.join(app.root_path, ".jinja_cache"))
+if JINJA_CACHE_DIR:
+    os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(JINJA_CACHE_DIR)
 
 def get_db_connection():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Conexão do pool vinculada ao contexto da aplicação.
+
+    Todas as chamadas dentro da mesma requisição recebem a mesma conexão;
+    ela volta ao pool no teardown.
+    """
+    if "db" not in g:
+        g.db = pool.acquire(scoped=True)
+    return g.db
+
+def get_read_connection():
+    """Conexão de leitura (replica.py) para buscas, exportações e relatórios.
+
+    Vem de um pool separado do das rotas da portaria e, no modo "replica",
+    lê a cópia, a menos que o usuário tenha gravado depois dela.
+    """
+    if "db_leitura" not in g:
+        g.db_leitura = replica.acquire(scoped=True, ultima_escrita=session.get("ultima_escrita", 0))
+    return g.db_leitura
+
+def versao_leitura():
+    """Versão dos dados que ``get_read_connection`` lê (ETags e cache de relatórios)"""
+    return replica.versao(session.get("ultima_escrita", 0))
+
+@app.teardown_appcontext
+def release_db_connection(exception):
+    for chave in ("db", "db_leitura"):
+        conn = g.pop(chave, None)
+        if conn is not None:
+            conn.release()
+
+@app.after_request
+def mark_user_write(response):
+    # Leitura das próprias escritas: depois de um POST o usuário lê do banco
+    # principal até a cópia de leitura ser mais nova que a escrita
+    if request.method == "POST" and request.endpoint != "login" and "username" in session:
+        session["ultima_escrita"] = time.time()
+    if request.method == "POST":
+        # A limpeza do feed não depende de haver telas conectadas
+        broker.prune_if_due()
+    return response
+
+# ==================== MÉTRICAS ====================
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    inicio = g.pop("request_start", None)
+    if inicio is not None:
+        endpoint = request.endpoint or "404"
+        metrics.REQUEST_DURATION.observe(time.perf_counter() - inicio, endpoint, request.method)
+        metrics.REQUESTS_TOTAL.inc(endpoint, request.method, response.status_code)
+    return response
+
+def start_template_timer(sender, template, context, **extra):
+    g.setdefault("template_starts", []).append(time.perf_counter())
+
+def record_template_metrics(sender, template, context, **extra):
+    inicios = g.get("template_starts")
+    if inicios:
+        metrics.TEMPLATE_RENDER.observe(time.perf_counter() - inicios.pop(), template.name or "?")
+
+before_render_template.connect(start_template_timer, app)
+template_rendered.connect(record_template_metrics, app)
+
+metrics.register_gauges("portaria_db_pool", pool.stats)
+metrics.register_gauges("portaria_permission_cache", permission_cache.stats)
+metrics.register_gauges("portaria_fragment_cache", fragment_cache.stats)
+metrics.register_gauges("portaria_relatorio_cache", relatorio_cache.stats)
+metrics.register_gauges("portaria_hashing_pool", lambda: hashing_pool.stats())
+metrics.register_gauges("portaria_writer", writer.stats)
+metrics.register_gauges("portaria_eventos", broker.stats)
+metrics.register_gauges("portaria_leitura", replica.stats)
+metrics.register_gauges("portaria_leitura_pool", replica.leitura_pool.stats)
+metrics.register_gauges("portaria_replica_pool", replica.replica_pool.stats)
 
 def init_db():
     if not os.path.exists(DATABASE):
         os.system("python3 setup_database_bcrypt.py")
-
-def check_password_bcrypt(password, hashed):
-    """Verifica senha usando bcrypt"""
-    return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
-
-def hash_password_bcrypt(password):
-    """Gera hash bcrypt para a senha"""
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    else:
+        run_migrations(verbose=False)
+        reconcile_dashboard_counters(verbose=False)
 
 def format_datetime_br(data, hora):
     """Formata data e hora para padrão brasileiro: dd/mm/aaaa hh:mm:ss"""
@@ -50,6 +149,10 @@ def format_datetime_br(data, hora):
     
     return f"{data} {hora}" if hora else data
 
+# Instantes (entrada_ts/saida_ts) e textos ISO: cada valor é formatado uma
+# única vez por processo, não a cada linha renderizada
+app.add_template_filter(datahora_br, 'datahora_br')
+
 # Adicionar filtro Jinja2 para formatação de datas
 @app.template_filter('format_datetime_br')
 def format_datetime_br_filter(value):
@@ -64,6 +167,43 @@ def format_datetime_br_filter(value):
     except:
         return value
 
+def render_navbar():
+    """Navbar do base.html, renderizada uma vez por usuário e perfil em cada worker.
+
+    Ela só depende do nome e de ``is_admin`` da sessão, que fazem parte da
+    chave; as rotas de admin que alteram um usuário também a invalidam.
+    """
+    chave = ("navbar", session.get("username"), bool(session.get("is_admin")))
+    html = None if app.jinja_env.auto_reload else fragment_cache.get(chave)
+    if html is None:
+        html = Markup(app.jinja_env.get_template("_navbar.html").render())
+        fragment_cache.set(chave, html)
+    return html
+
+app.add_template_global(render_navbar, "navbar")
+
+def url_registro(endpoint, id):
+    """``url_for(endpoint, id=id)`` das ações de cada linha da consulta.
+
+    A rota é montada uma vez por endpoint e a linha só troca o id: em uma
+    página de 1000 linhas o url_for era a maior parte da renderização.
+    """
+    chave = ("url", endpoint, request.script_root)
+    molde = fragment_cache.get(chave)
+    if molde is None:
+        molde = url_for(endpoint, id=0).rsplit("0", 1)
+        fragment_cache.set(chave, molde)
+    return f"{molde[0]}{int(id)}{molde[1]}"
+
+app.add_template_global(url_registro, "url_registro")
+
+def precompile_templates():
+    """Compila todos os templates para JINJA_CACHE_DIR; devolve quantos"""
+    nomes = app.jinja_env.list_templates(extensions=["html"])
+    for nome in nomes:
+        app.jinja_env.get_template(nome)
+    return len(nomes)
+
 def is_logged_in():
     return "username" in session
 
@@ -92,20 +232,71 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# Traço de placa ("ABC-12", enquanto se digita) ou espaço de placa completa ("ABC 1234")
+PLACA_SEPARADOR = re.compile(r"(?<=\b[A-Za-z]{3})(?:-(?=\d)| (?=\d[A-Za-z0-9]\d\d\b))")
+
+def fts_match(column, texto):
+    """Monta a expressão FTS5 de busca por prefixo em uma coluna de controle_fts.
+
+    Cada palavra digitada vira um termo de prefixo entre aspas, o que também
+    neutraliza a sintaxe do FTS5 vinda do usuário. Retorna None se não sobrar
+    nenhuma palavra. Sem ``column`` a busca vale para todas as colunas do
+    índice.
+    """
+    if column == "placa":
+        texto = texto.upper().replace("-", "").replace(" ", "")
+    elif column is None:
+        # A placa está no índice sem traço: "ABC-1234" vira "ABC1234"
+        texto = PLACA_SEPARADOR.sub("", texto)
+    termos = re.findall(r"\w+", texto)
+    if not termos:
+        return None
+    expressao = " ".join(f'"{termo}"*' for termo in termos)
+    return f"{column} : ({expressao})" if column else f"({expressao})"
+
+def load_user_permissions(username):
+    """Permissões (colunas lib* e is_admin) do usuário, com cache por worker.
+
+    O cache é invalidado pelas rotas de admin que alteram o usuário; nos
+    demais workers a entrada expira em PERMISSION_CACHE_TTL segundos.
+    """
+    perms = permission_cache.get(username)
+    if perms is None:
+        conn = get_db_connection()
+        user = conn.execute(
+            "SELECT * FROM usuarios WHERE username = ?", 
+            (username,)
+        ).fetchone()
+        conn.close()
+        perms = {k: user[k] for k in user.keys() if k.startswith("lib") or k == "is_admin"} if user else {}
+        permission_cache.set(username, perms)
+    return perms
+
+def invalidate_user_permissions(*usernames):
+    for username in usernames:
+        if username:
+            permission_cache.invalidate(username)
+            for admin in (False, True):
+                fragment_cache.invalidate(("navbar", username, admin))
+
 def check_permission(permission):
     if not is_logged_in():
         return False
     
-    conn = get_db_connection()
-    user = conn.execute(
-        "SELECT * FROM usuarios WHERE username = ?", 
-        (session["username"],)
-    ).fetchone()
-    conn.close()
-    
-    if user:
-        return user[permission] == "sim"
-    return False
+    return load_user_permissions(session["username"]).get(permission) == "sim"
+
+def upgrade_password_in_background(username, senha, hash_antigo):
+    def gravar(novo_hash):
+        # Só substitui se a senha não foi trocada enquanto o hash era calculado
+        with pool.connection() as conn:
+            conn.execute(
+                "UPDATE usuarios SET senha = ? WHERE username = ? AND senha = ?",
+                (novo_hash, username, hash_antigo)
+            )
+            conn.commit()
+        app.logger.info("Senha de %s atualizada para bcrypt", username)
+    
+    rehash_in_background(senha, gravar)
 
 @app.route("/")
 def index():
@@ -135,12 +326,12 @@ def login():
         flash("Usuário não encontrado!", "error")
         return redirect(url_for("index"))
     
-    # Verificar senha (suporta bcrypt e texto plano)
-    senha_valida = False
-    if user["senha"].startswith("$2b$"):  # Hash bcrypt
-        senha_valida = check_password_bcrypt(senha, user["senha"])
-    else:  # Senha em texto plano (legado)
-        senha_valida = (user["senha"] == senha)
+    # Verificar senha (suporta bcrypt e texto plano legado)
+    try:
+        senha_valida = verify_password(senha, user["senha"])
+    except HashingBusy:
+        flash("Muitos acessos simultâneos. Tente novamente em alguns segundos.", "error")
+        return redirect(url_for("index"))
     
     if not senha_valida:
         flash("A senha está incorreta!", "error")
@@ -151,7 +342,12 @@ def login():
         flash("O IP está incorreto!", "error")
         return redirect(url_for("index"))
     
-    # Login bem-sucedido
+    # Senha legada ou com custo antigo: regrava com o bcrypt atual em segundo plano
+    if needs_rehash(user["senha"]):
+        upgrade_password_in_background(username, senha, user["senha"])
+    
+    # Login bem-sucedido: permissões são recarregadas na próxima verificação
+    invalidate_user_permissions(username)
     session["username"] = username
     session["senha"] = senha
     session["ip"] = ip_rede if user["ip"] == "livre" else user["ip"]
@@ -167,17 +363,22 @@ def logout():
 @app.route("/dashboard")
 @login_required
 def dashboard():
+    return render_template("dashboard.html", **get_dashboard_dados(datetime.now().strftime("%Y-%m-%d")))
+
+def get_dashboard_dados(hoje):
+    """Contadores e últimos registros exibidos no dashboard"""
     conn = get_db_connection()
     
-    hoje = datetime.now().strftime("%Y-%m-%d")
-    registros_hoje = conn.execute(
-        "SELECT COUNT(*) as count FROM controle WHERE data_entrada = ?", 
+    # Contadores mantidos por triggers (ver migração 4 em setup_database_bcrypt.py)
+    row = conn.execute(
+        "SELECT entradas FROM contagem_diaria WHERE data = ?", 
         (hoje,)
-    ).fetchone()["count"]
+    ).fetchone()
+    registros_hoje = row["entradas"] if row else 0
     
     veiculos_dentro = conn.execute(
-        "SELECT COUNT(*) as count FROM controle WHERE data_saida = \"\" OR data_saida IS NULL"
-    ).fetchone()["count"]
+        "SELECT valor FROM contadores WHERE chave = 'veiculos_dentro'"
+    ).fetchone()["valor"]
     
     ultimos_registros = conn.execute(
         """SELECT * FROM controle 
@@ -187,10 +388,11 @@ def dashboard():
     
     conn.close()
     
-    return render_template("dashboard.html", 
-                         registros_hoje=registros_hoje,
-                         veiculos_dentro=veiculos_dentro,
-                         ultimos_registros=ultimos_registros)
+    return {
+        "registros_hoje": registros_hoje,
+        "veiculos_dentro": veiculos_dentro,
+        "ultimos_registros": ultimos_registros,
+    }
 
 # ==================== ROTAS DE ADMIN ====================
 
@@ -203,7 +405,7 @@ def admin_panel():
     usuarios = conn.execute("SELECT * FROM usuarios ORDER BY username").fetchall()
     conn.close()
     
-    return render_template("admin_panel.html", usuarios=usuarios)
+    return render_template("admin_panel.html", usuarios=usuarios, leitura=replica.stats())
 
 @app.route("/admin/usuario/novo")
 @login_required
@@ -233,7 +435,11 @@ def admin_criar_usuario():
         return redirect(url_for("admin_novo_usuario"))
     
     # Hash da senha usando bcrypt
-    senha_hash = hash_password_bcrypt(senha)
+    try:
+        senha_hash = hash_password_bcrypt(senha)
+    except HashingBusy:
+        flash("Servidor ocupado. Tente novamente em alguns segundos.", "error")
+        return redirect(url_for("admin_novo_usuario"))
     
     try:
         conn = get_db_connection()
@@ -262,6 +468,7 @@ def admin_criar_usuario():
         ))
         conn.commit()
         conn.close()
+        invalidate_user_permissions(username)
         
         flash(f"Usuário {username} criado com sucesso!", "success")
         return redirect(url_for("admin_panel"))
@@ -306,6 +513,7 @@ def admin_atualizar_usuario(user_id):
     
     try:
         conn = get_db_connection()
+        anterior = conn.execute("SELECT username FROM usuarios WHERE id = ?", (user_id,)).fetchone()
         conn.execute("""
             UPDATE usuarios SET
                 username = ?, ip = ?, is_admin = ?,
@@ -314,6 +522,7 @@ def admin_atualizar_usuario(user_id):
         """, (username, ip, is_admin_flag, libinserir, libalterar, libexcluir, libconsulta, user_id))
         conn.commit()
         conn.close()
+        invalidate_user_permissions(username, anterior["username"] if anterior else None)
         
         flash(f"Usuário {username} atualizado com sucesso!", "success")
         return redirect(url_for("admin_panel"))
@@ -354,7 +563,11 @@ def admin_alterar_senha(user_id):
         return redirect(url_for("admin_alterar_senha_form", user_id=user_id))
     
     # Hash da senha usando bcrypt
-    senha_hash = hash_password_bcrypt(nova_senha)
+    try:
+        senha_hash = hash_password_bcrypt(nova_senha)
+    except HashingBusy:
+        flash("Servidor ocupado. Tente novamente em alguns segundos.", "error")
+        return redirect(url_for("admin_alterar_senha_form", user_id=user_id))
     
     try:
         conn = get_db_connection()
@@ -363,6 +576,7 @@ def admin_alterar_senha(user_id):
         
         usuario = conn.execute("SELECT username FROM usuarios WHERE id = ?", (user_id,)).fetchone()
         conn.close()
+        invalidate_user_permissions(usuario["username"])
         
         flash(f"Senha do usuário {usuario['username']} alterada com sucesso!", "success")
         return redirect(url_for("admin_panel"))
@@ -388,6 +602,7 @@ def admin_excluir_usuario(user_id):
         conn.execute("DELETE FROM usuarios WHERE id = ?", (user_id,))
         conn.commit()
         conn.close()
+        invalidate_user_permissions(usuario["username"] if usuario else None)
         
         flash(f"Usuário {usuario['username']} excluído com sucesso!", "success")
         
@@ -396,8 +611,111 @@ def admin_excluir_usuario(user_id):
     
     return redirect(url_for("admin_panel"))
 
+@app.route("/admin/contadores/reconciliar", methods=["POST"])
+@login_required
+@admin_required
+def admin_reconciliar_contadores():
+    """Confere os contadores do dashboard com as contagens reais"""
+    try:
+        divergencias = reconcile_dashboard_counters(verbose=False)
+        if divergencias:
+            flash(f"Contadores corrigidos: {len(divergencias)} divergência(s) encontrada(s).", "success")
+        else:
+            flash("Contadores do dashboard conferidos: nenhuma divergência.", "success")
+    except Exception as e:
+        flash(f"Erro ao reconciliar contadores: {str(e)}", "error")
+    
+    return redirect(url_for("admin_panel"))
+
+@app.route("/admin/replica/atualizar", methods=["POST"])
+@login_required
+@admin_required
+def admin_atualizar_replica():
+    """Atualiza agora a cópia de leitura (modo "replica")"""
+    if replica.LEITURA_MODO != "replica":
+        flash("A leitura usa o banco principal (LEITURA_MODO=primario): não há cópia a atualizar.", "error")
+        return redirect(url_for("admin_panel"))
+    try:
+        replica.replicador.atualizar(forcar=True)
+        flash(f"Cópia de leitura atualizada em {replica.replicador.ultima_duracao:.1f} s.", "success")
+    except Exception as e:
+        flash(f"Erro ao atualizar a cópia de leitura: {str(e)}", "error")
+    
+    return redirect(url_for("admin_panel"))
+
+RELATORIO_DIAS_PADRAO = 30
+
+def ler_periodo_relatorio(args):
+    """Período e filtros do relatório a partir da query string; devolve (inicio, fim, filtros, erro)"""
+    hoje = datetime.now().date()
+    try:
+        fim = datetime.strptime(args.get("data_fim") or hoje.isoformat(), "%Y-%m-%d").date()
+        inicio = datetime.strptime(
+            args.get("data_inicio") or (fim - timedelta(days=RELATORIO_DIAS_PADRAO - 1)).isoformat(), "%Y-%m-%d"
+        ).date()
+    except ValueError:
+        return None, None, None, "Data inválida (use AAAA-MM-DD)."
+    filtros = {campo: args.get(campo, "").strip() for campo in RELATORIO_FILTROS}
+    if inicio > fim:
+        return inicio, fim, filtros, "A data inicial é posterior à data final."
+    return inicio, fim, filtros, None
+
+@app.route("/admin/relatorios")
+@login_required
+@admin_required
+def admin_relatorios():
+    """Relatórios gerenciais: permanência, horários de pico, volumes e excessos"""
+    inicio, fim, filtros, erro = ler_periodo_relatorio(request.args)
+    relatorio = None
+    if erro:
+        flash(erro, "error")
+    else:
+        relatorio = obter_relatorio(get_read_connection(), inicio, fim, filtros, versao_leitura())
+    
+    return render_template("admin_relatorios.html", relatorio=relatorio, dias_semana=DIAS_SEMANA,
+                           max_dias=RELATORIO_MAX_DIAS,
+                           data_inicio=inicio.isoformat() if inicio else "",
+                           data_fim=fim.isoformat() if fim else "",
+                           **(filtros or {}))
+
+@app.route("/api/relatorios")
+@login_required
+@admin_required
+def api_relatorios():
+    inicio, fim, filtros, erro = ler_periodo_relatorio(request.args)
+    if erro:
+        return jsonify(erro=erro), 400
+    versao = versao_leitura()
+    etag = api_etag("relatorios", versao, inicio, fim, *filtros.values())
+    return json_condicional(etag, lambda: obter_relatorio(get_read_connection(), inicio, fim, filtros, versao))
+
+@app.route("/metrics")
+@login_required
+@admin_required
+def metrics_endpoint():
+    """Métricas deste worker no formato texto do Prometheus"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+@app.route("/admin/db_stats")
+@login_required
+@admin_required
+def admin_db_stats():
+    """Contadores do pool de conexões, dos caches, do escritor e do feed ao vivo deste worker"""
+    return jsonify(pid=os.getpid(), pool=pool.stats(), permission_cache=permission_cache.stats(),
+                   fragment_cache=fragment_cache.stats(),
+                   hashing_pool=hashing_pool.stats(), writer=writer.stats(), eventos=broker.stats(),
+                   leitura=replica.stats())
+
 # ==================== ROTAS EXISTENTES ====================
 
+INSERT_CONTROLE_SQL = """
+    INSERT INTO controle (
+        destino, tipo, empresa, nome, rg, veiculo, placa, cr,
+        data_entrada, data_saida, hora_entrada, hora_saida,
+        n_nota, obs, periodo, periodoalterado, usuario, usuarioalterado, data_alterada
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
 @app.route("/novo_registro")
 @login_required
 def novo_registro():
@@ -431,20 +749,13 @@ def salvar_registro():
     usuario = session["username"]
     
     try:
-        conn = get_db_connection()
-        conn.execute("""
-            INSERT INTO controle (
-                destino, tipo, empresa, nome, rg, veiculo, placa, cr,
-                data_entrada, data_saida, hora_entrada, hora_saida,
-                n_nota, obs, periodo, periodoalterado, usuario, usuarioalterado, data_alterada
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
+        # O escritor agrupa inserções simultâneas em um só commit e só
+        # retorna depois que o grupo foi gravado
+        writer.execute(INSERT_CONTROLE_SQL, (
             destino, tipo, empresa, nome, rg, veiculo, placa, cr,
             data_entrada, "", hora_entrada, "",
             n_nota, obs, periodo, "", usuario, "", ""
         ))
-        conn.commit()
-        conn.close()
         
         flash("Registro salvo com sucesso!", "success")
         return redirect(url_for("dashboard"))
@@ -453,6 +764,378 @@ def salvar_registro():
         flash(f"Erro ao salvar registro: {str(e)}", "error")
         return redirect(url_for("novo_registro"))
 
+# ==================== REGISTROS EM LOTE ====================
+
+LOTE_MAX = int(os.environ.get("LOTE_MAX", "100"))
+
+# Campos comuns a todo o lote (comboio, ônibus) e campos de cada veículo/pessoa
+LOTE_CAMPOS_COMUNS = ("destino", "tipo", "empresa", "data_entrada", "hora_entrada", "obs")
+LOTE_CAMPOS_LINHA = ("nome", "rg", "veiculo", "placa", "cr", "n_nota")
+REGISTRO_CAMPOS = LOTE_CAMPOS_COMUNS + LOTE_CAMPOS_LINHA
+REGISTRO_OBRIGATORIOS = {
+    "destino": "Destino", "tipo": "Tipo", "empresa": "Empresa", "nome": "Nome", "placa": "Placa",
+}
+
+def validar_registro(dados, agora):
+    """Normaliza um registro recebido em lote; devolve (valores, erros)"""
+    if not isinstance(dados, dict):
+        return {}, ["Registro inválido"]
+    valores = {campo: str(dados.get(campo) or "").strip() for campo in REGISTRO_CAMPOS}
+    valores["placa"] = valores["placa"].upper()
+    valores["data_entrada"] = valores["data_entrada"] or agora.strftime("%Y-%m-%d")
+    valores["hora_entrada"] = valores["hora_entrada"] or agora.strftime("%H:%M")
+    erros = [f"{rotulo} é obrigatório" for campo, rotulo in REGISTRO_OBRIGATORIOS.items() if not valores[campo]]
+    try:
+        datetime.strptime(valores["data_entrada"], "%Y-%m-%d")
+    except ValueError:
+        erros.append("Data de entrada inválida (use AAAA-MM-DD)")
+    if not re.fullmatch(r"\d{2}:\d{2}(:\d{2})?", valores["hora_entrada"]):
+        erros.append("Hora de entrada inválida (use HH:MM)")
+    return valores, erros
+
+def ler_lote_entradas():
+    """Linhas do lote vindas de JSON ({"registros": [...]}) ou do formulário de várias linhas.
+
+    Devolve uma lista de (número da linha, dados) ou None se o corpo for inválido.
+    """
+    if request.is_json:
+        corpo = request.get_json(silent=True)
+        linhas = corpo.get("registros") if isinstance(corpo, dict) else corpo
+        if not isinstance(linhas, list):
+            return None
+        return list(enumerate(linhas, start=1))
+
+    comuns = {campo: request.form.get(campo, "") for campo in LOTE_CAMPOS_COMUNS}
+    colunas = {campo: request.form.getlist(campo) for campo in LOTE_CAMPOS_LINHA}
+    total = max(len(valores) for valores in colunas.values())
+    linhas = []
+    for i in range(total):
+        dados = {campo: (valores[i] if i < len(valores) else "") for campo, valores in colunas.items()}
+        # Linhas em branco do formulário são ignoradas
+        if any(valor.strip() for valor in dados.values()):
+            linhas.append((i + 1, dict(comuns, **dados)))
+    return linhas
+
+def inserir_lote(conn, parametros):
+    """Insere todas as linhas com um único executemany; devolve os ids gerados"""
+    conn.executemany(INSERT_CONTROLE_SQL, parametros)
+    # Dentro da transação do escritor ninguém mais insere: os ids são consecutivos
+    ultimo = conn.execute("SELECT max(id) FROM controle").fetchone()[0]
+    return list(range(ultimo - len(parametros) + 1, ultimo + 1))
+
+def registrar_saidas_lote(conn, ids, valores):
+    """Fecha as entradas em aberto entre ``ids``; devolve {id: situação}"""
+    marcadores = ",".join("?" * len(ids))
+    situacao = {
+        row["id"]: ("ja_saiu" if row["data_saida"] else "ok")
+        for row in conn.execute(f"SELECT id, data_saida FROM controle WHERE id IN ({marcadores})", ids)
+    }
+    abertos = [id for id in ids if situacao.get(id) == "ok"]
+    conn.executemany("""
+        UPDATE controle SET
+            data_saida = ?, hora_saida = ?, periodoalterado = ?, usuarioalterado = ?, data_alterada = ?
+        WHERE id = ?
+    """, [valores + (id,) for id in abertos])
+    return situacao
+
+@app.route("/novo_registro_lote")
+@login_required
+def novo_registro_lote():
+    if not check_permission("libinserir"):
+        flash("Você não tem permissão para inserir registros!", "error")
+        return redirect(url_for("dashboard"))
+    
+    return render_template("novo_registro_lote.html", comuns={}, linhas=[], erros={}, lote_max=LOTE_MAX)
+
+@app.route("/registros/lote", methods=["POST"])
+@login_required
+def salvar_registros_lote():
+    """Entrada de vários veículos em uma só requisição e uma só transação"""
+    via_json = request.is_json
+    if not check_permission("libinserir"):
+        if via_json:
+            return jsonify(erro="Você não tem permissão para inserir registros!"), 403
+        flash("Você não tem permissão para inserir registros!", "error")
+        return redirect(url_for("dashboard"))
+    
+    linhas = ler_lote_entradas()
+    erro = None
+    if linhas is None:
+        erro = 'Corpo inválido: envie {"registros": [...]}'
+    elif not linhas:
+        erro = "Nenhum registro informado"
+    elif len(linhas) > LOTE_MAX:
+        erro = f"No máximo {LOTE_MAX} registros por lote"
+    if erro:
+        if via_json:
+            return jsonify(erro=erro), 400
+        flash(erro, "error")
+        return redirect(url_for("novo_registro_lote"))
+    
+    agora = datetime.now()
+    periodo = agora.strftime("%Y-%m-%d %H:%M:%S")
+    usuario = session["username"]
+    resultados = []
+    validos = []
+    for numero, dados in linhas:
+        valores, erros = validar_registro(dados, agora)
+        resultado = {"linha": numero, "ok": not erros}
+        if erros:
+            resultado["erros"] = erros
+        else:
+            validos.append((resultado, (
+                valores["destino"], valores["tipo"], valores["empresa"], valores["nome"], valores["rg"],
+                valores["veiculo"], valores["placa"], valores["cr"],
+                valores["data_entrada"], "", valores["hora_entrada"], "",
+                valores["n_nota"], valores["obs"], periodo, "", usuario, "", ""
+            )))
+        resultados.append(resultado)
+    
+    if validos:
+        parametros = [params for _, params in validos]
+        try:
+            ids = writer.run(lambda conn: inserir_lote(conn, parametros))
+        except Exception as e:
+            ids = None
+            for resultado, _ in validos:
+                resultado.update(ok=False, erros=[f"Erro ao salvar registro: {str(e)}"])
+        if ids:
+            for (resultado, _), id in zip(validos, ids):
+                resultado["id"] = id
+    
+    inseridos = sum(1 for resultado in resultados if resultado["ok"])
+    rejeitados = len(resultados) - inseridos
+    if via_json:
+        status = 200 if inseridos else 400
+        return jsonify(inseridos=inseridos, rejeitados=rejeitados, resultados=resultados), status
+    
+    if inseridos:
+        flash(f"{inseridos} registro(s) salvo(s) com sucesso!", "success")
+    if not rejeitados:
+        return redirect(url_for("dashboard"))
+    
+    # Devolve o formulário só com as linhas recusadas, já preenchidas
+    dados_por_linha = dict(linhas)
+    recusadas = [r for r in resultados if not r["ok"]]
+    flash(f"{rejeitados} registro(s) não foram salvos. Corrija e envie novamente.", "error")
+    comuns = {campo: request.form.get(campo, "") for campo in LOTE_CAMPOS_COMUNS}
+    return render_template(
+        "novo_registro_lote.html",
+        comuns=comuns,
+        linhas=[dados_por_linha[r["linha"]] for r in recusadas],
+        erros={i: r["erros"] for i, r in enumerate(recusadas)},
+        lote_max=LOTE_MAX,
+    )
+
+def ids_do_lote(brutos):
+    """Ids sem repetição de uma lista de inteiros (ou de textos só com dígitos, do formulário).
+
+    None se não for uma lista ou se algum item não for inteiro: um texto como
+    "123" não pode virar os ids 1, 2 e 3.
+    """
+    if not isinstance(brutos, list):
+        return None
+    ids = []
+    for item in brutos:
+        if isinstance(item, str) and item.isascii() and item.isdigit():
+            item = int(item)
+        if not isinstance(item, int) or isinstance(item, bool):
+            return None
+        ids.append(item)
+    return list(dict.fromkeys(ids))
+
+@app.route("/registros/saida_lote", methods=["POST"])
+@login_required
+def registrar_saida_lote():
+    """Saída de vários registros de uma vez; resultado por id"""
+    via_json = request.is_json
+    if not check_permission("libalterar"):
+        if via_json:
+            return jsonify(erro="Você não tem permissão para alterar registros!"), 403
+        flash("Você não tem permissão para alterar registros!", "error")
+        return redirect(url_for("consultar"))
+    
+    if via_json:
+        corpo = request.get_json(silent=True)
+        brutos = corpo.get("ids") if isinstance(corpo, dict) else corpo
+    else:
+        brutos = request.form.getlist("ids")
+    ids = ids_do_lote(brutos)
+    
+    erro = None
+    if ids is None:
+        erro = 'Corpo inválido: envie {"ids": [...]} com ids inteiros'
+    elif not ids:
+        erro = "Nenhum registro selecionado"
+    elif len(ids) > LOTE_MAX:
+        erro = f"No máximo {LOTE_MAX} registros por lote"
+    if erro:
+        if via_json:
+            return jsonify(erro=erro), 400
+        flash(erro, "error")
+        return redirect(url_for("consultar"))
+    
+    agora = datetime.now()
+    valores = (agora.strftime("%Y-%m-%d"), agora.strftime("%H:%M:%S"), agora.strftime("%Y-%m-%d %H:%M:%S"),
+               session["username"], agora.strftime("%Y-%m-%d"))
+    try:
+        situacao = writer.run(lambda conn: registrar_saidas_lote(conn, ids, valores))
+    except Exception as e:
+        if via_json:
+            return jsonify(erro=f"Erro ao registrar saída: {str(e)}"), 500
+        flash(f"Erro ao registrar saída: {str(e)}", "error")
+        return redirect(url_for("consultar"))
+    
+    mensagens = {"ja_saiu": "Saída já registrada", None: "Registro não encontrado"}
+    resultados = []
+    for id in ids:
+        estado = situacao.get(id)
+        resultado = {"id": id, "ok": estado == "ok"}
+        if estado != "ok":
+            resultado["erro"] = mensagens[estado]
+        resultados.append(resultado)
+    
+    registradas = sum(1 for resultado in resultados if resultado["ok"])
+    if via_json:
+        return jsonify(registradas=registradas, rejeitadas=len(ids) - registradas, resultados=resultados)
+    
+    if registradas:
+        flash(f"Saída registrada para {registradas} registro(s)!", "success")
+    for resultado in resultados:
+        if not resultado["ok"]:
+            flash(f"Registro {resultado['id']}: {resultado['erro']}", "error")
+    return redirect(url_for("consultar"))
+
+CONSULTA_PAGE_SIZE = 100
+
+def get_consulta_filtros(args):
+    """Lê os filtros da tela de consulta a partir da query string"""
+    return {
+        "empresa": args.get("empresa", ""),
+        "nome": args.get("nome", ""),
+        "placa": args.get("placa", ""),
+        "data_inicio": args.get("data_inicio", ""),
+        "data_fim": args.get("data_fim", ""),
+        "status": args.get("status", ""),
+        "q": args.get("q", "").strip(),
+    }
+
+def dia_epoch(texto):
+    """Início do dia "AAAA-MM-DD" como instante; None se vazio ou inválido"""
+    try:
+        return para_epoch(datetime.strptime(texto, "%Y-%m-%d").date())
+    except ValueError:
+        return None
+
+def build_consulta_where(filtros, esquema="main"):
+    """Monta o WHERE de controle para os filtros da consulta (no banco ``esquema``)"""
+    where = "1=1"
+    params = []
+    
+    # Filtros de texto passam pelo índice FTS5 (prefixo, sem acentos)
+    termos = [fts_match(coluna, filtros[coluna])
+              for coluna in ("empresa", "nome", "placa")
+              if filtros[coluna]]
+    # Busca livre (campo de busca da consulta): qualquer coluna do índice
+    if filtros["q"]:
+        termos.append(fts_match(None, filtros["q"]))
+    termos = [termo for termo in termos if termo]
+    if termos:
+        where += f" AND id IN (SELECT rowid FROM {esquema}.controle_fts WHERE controle_fts MATCH ?)"
+        params.append(" AND ".join(termos))
+    
+    # Período como faixa de instantes no índice de entrada_ts (o dia final inteiro)
+    inicio = dia_epoch(filtros["data_inicio"])
+    if inicio is not None:
+        where += " AND entrada_ts >= ?"
+        params.append(inicio)
+    
+    fim = dia_epoch(filtros["data_fim"])
+    if fim is not None:
+        where += " AND entrada_ts < ?"
+        params.append(fim + 86400)
+    
+    if filtros["status"] == "dentro":
+        where += " AND data_saida = ''"
+    elif filtros["status"] == "saiu":
+        where += " AND data_saida != ''"
+    
+    return where, params
+
+def page_sql(where, ordem, esquema="main"):
+    """SELECT de uma página: filtra, ordena e limita só os ids e depois busca as linhas.
+
+    Cada linha traz a ``fonte``: 'main' ou o esquema do arquivo anual, que é
+    somente leitura.
+
+    Com filtro de período, o índice de entrada_ts cobre a subconsulta; sem
+    ela, o SQLite leria e ordenaria as linhas completas de toda a faixa.
+    """
+    return (f"SELECT *, '{esquema}' AS fonte FROM {esquema}.controle WHERE id IN ("
+            f"SELECT id FROM {esquema}.controle WHERE {where} ORDER BY id {ordem} LIMIT ?"
+            f") ORDER BY id {ordem}")
+
+def consulta_fontes(conn, filtros):
+    """'main' e os arquivos anuais (archive.py) que o período da consulta alcança"""
+    if filtros["status"] == "dentro":
+        return ["main"]
+    fim = dia_epoch(filtros["data_fim"])
+    return archive.fontes(conn, dia_epoch(filtros["data_inicio"]), fim + 86400 if fim is not None else None)
+
+def registro_ausente(conn, id):
+    """Avisa por que ``id`` não está em main.controle: arquivado (somente leitura) ou inexistente"""
+    for esquema in archive.fontes(conn, 0)[1:]:
+        if conn.execute(f"SELECT 1 FROM {esquema}.controle WHERE id = ?", (id,)).fetchone():
+            flash("Registro arquivado: movimentações antigas são somente leitura.", "error")
+            return
+    flash("Registro não encontrado!", "error")
+
+def select_pagina(conn, fontes, filtros, condicao, valores, ordem, limite):
+    """Até ``limite`` linhas em ordem de id em todas as fontes.
+
+    Cada fonte limita os próprios ids pelo índice e o UNION ALL só ordena o
+    que sobrou de cada uma.
+    """
+    partes = []
+    params = []
+    for esquema in fontes:
+        where, where_params = build_consulta_where(filtros, esquema)
+        partes.append(page_sql(where + condicao, ordem, esquema))
+        params += where_params + valores + [limite]
+    if len(partes) == 1:
+        return conn.execute(partes[0], params).fetchall()
+    sql = " UNION ALL ".join(f"SELECT * FROM ({parte})" for parte in partes)
+    return conn.execute(f"{sql} ORDER BY id {ordem} LIMIT ?", params + [limite]).fetchall()
+
+def fetch_page(conn, filtros, after_id=None, before_id=None, page_size=CONSULTA_PAGE_SIZE):
+    """Paginação por chave (keyset) em id, do mais novo para o mais antigo.
+
+    ``after_id`` traz a página seguinte (ids menores), ``before_id`` a
+    anterior (ids maiores). Cada página custa uma busca no índice de cada
+    fonte, qualquer que seja a profundidade. Retorna (registros,
+    tem_mais_antigos, tem_mais_novos).
+    """
+    fontes = consulta_fontes(conn, filtros)
+    if before_id is not None:
+        rows = select_pagina(conn, fontes, filtros, " AND id > ?", [before_id], "ASC", page_size + 1)
+        tem_mais_novos = len(rows) > page_size
+        registros = list(reversed(rows[:page_size]))
+        tem_mais_antigos = bool(registros) and bool(
+            select_pagina(conn, fontes, filtros, " AND id < ?", [registros[-1]["id"]], "DESC", 1)
+        )
+        return registros, tem_mais_antigos, tem_mais_novos
+    
+    if after_id is not None:
+        rows = select_pagina(conn, fontes, filtros, " AND id < ?", [after_id], "DESC", page_size + 1)
+    else:
+        rows = select_pagina(conn, fontes, filtros, "", [], "DESC", page_size + 1)
+    tem_mais_antigos = len(rows) > page_size
+    registros = rows[:page_size]
+    tem_mais_novos = after_id is not None and bool(registros) and bool(
+        select_pagina(conn, fontes, filtros, " AND id > ?", [registros[0]["id"]], "ASC", 1)
+    )
+    return registros, tem_mais_antigos, tem_mais_novos
+
 @app.route("/consultar")
 @login_required
 def consultar():
@@ -460,56 +1143,296 @@ def consultar():
         flash("Você não tem permissão para consultar registros!", "error")
         return redirect(url_for("dashboard"))
     
-    empresa = request.args.get("empresa", "")
-    nome = request.args.get("nome", "")
-    placa = request.args.get("placa", "")
-    data_inicio = request.args.get("data_inicio", "")
-    data_fim = request.args.get("data_fim", "")
-    status = request.args.get("status", "")
+    filtros = get_consulta_filtros(request.args)
+    after_id = request.args.get("after_id", type=int)
+    before_id = request.args.get("before_id", type=int)
     
-    conn = get_db_connection()
+    conn = get_read_connection()
+    registros, tem_mais_antigos, tem_mais_novos = fetch_page(
+        conn, filtros, after_id=after_id, before_id=before_id
+    )
+    arquivado_ate = archive.corte(conn)
+    conn.close()
     
-    query = "SELECT * FROM controle WHERE 1=1"
-    params = []
+    return render_template("consultar.html", 
+                         registros=registros,
+                         filtros={k: v for k, v in filtros.items() if v},
+                         tem_mais_antigos=tem_mais_antigos,
+                         tem_mais_novos=tem_mais_novos,
+                         arquivado_ate=de_epoch(arquivado_ate).date().isoformat() if arquivado_ate else "",
+                         **filtros)
+
+@app.route("/consultar/busca")
+@login_required
+def consultar_busca():
+    """Busca enquanto se digita: a página de resultados já renderizada, em JSON.
+
+    Mesmos filtros e cursores de /consultar, mais a busca livre ``q``. O
+    navegador só troca o fragmento, sem montar linhas nem filtrar a tabela.
+    """
+    if not check_permission("libconsulta"):
+        return jsonify(erro="Você não tem permissão para consultar registros!"), 403
+    
+    filtros = get_consulta_filtros(request.args)
+    after_id = request.args.get("after_id", type=int)
+    before_id = request.args.get("before_id", type=int)
+    
+    def gerar():
+        conn = get_read_connection()
+        registros, tem_mais_antigos, tem_mais_novos = fetch_page(
+            conn, filtros, after_id=after_id, before_id=before_id
+        )
+        html = render_template("_consultar_resultados.html",
+                               registros=registros,
+                               filtros={k: v for k, v in filtros.items() if v},
+                               tem_mais_antigos=tem_mais_antigos,
+                               tem_mais_novos=tem_mais_novos)
+        return {"html": html, "total": len(registros), "tem_mais_antigos": tem_mais_antigos, "q": filtros["q"]}
+    
+    chave = sorted(filtros.items()) + [("after_id", after_id), ("before_id", before_id)]
+    return json_condicional(api_etag("busca", versao_leitura(), chave), gerar)
+
+# ==================== API JSON ====================
+
+def registro_to_dict(registro):
+    return dict(registro)
+
+def api_etag(*partes):
+    """ETag forte: versão dos dados mais o que muda a resposta (data, filtros)"""
+    chave = "|".join(str(parte) for parte in (data_version(),) + partes)
+    return hashlib.sha1(chave.encode("utf-8")).hexdigest()
+
+def json_condicional(etag, gerar):
+    """304 sem tocar no banco se o cliente já tem esta versão; senão o JSON de ``gerar()``.
+
+    A ETag é calculada antes da consulta: se os dados mudarem no meio, a
+    resposta sai mais nova que a ETag e o próximo poll só busca de novo.
+    """
+    if request.if_none_match.contains(etag):
+        resposta = Response(status=304)
+    else:
+        resposta = jsonify(gerar())
+    resposta.set_etag(etag)
+    resposta.headers["Cache-Control"] = "private, no-cache"
+    return resposta
+
+@app.route("/api/dashboard")
+@login_required
+def api_dashboard():
+    """Contadores e últimos registros do dashboard"""
+    hoje = datetime.now().strftime("%Y-%m-%d")
     
-    if empresa:
-        query += " AND empresa LIKE ?"
-        params.append(f"%{empresa}%")
+    def gerar():
+        dados = get_dashboard_dados(hoje)
+        dados["ultimos_registros"] = [registro_to_dict(r) for r in dados["ultimos_registros"]]
+        return dados
     
-    if nome:
-        query += " AND nome LIKE ?"
-        params.append(f"%{nome}%")
+    return json_condicional(api_etag("dashboard", hoje), gerar)
+
+@app.route("/api/registros")
+@login_required
+def api_registros():
+    """Página de registros com os mesmos filtros e cursores de /consultar"""
+    if not check_permission("libconsulta"):
+        return jsonify(erro="Você não tem permissão para consultar registros!"), 403
+    
+    filtros = get_consulta_filtros(request.args)
+    after_id = request.args.get("after_id", type=int)
+    before_id = request.args.get("before_id", type=int)
+    
+    def gerar():
+        conn = get_read_connection()
+        registros, tem_mais_antigos, tem_mais_novos = fetch_page(
+            conn, filtros, after_id=after_id, before_id=before_id
+        )
+        return {
+            "registros": [registro_to_dict(r) for r in registros],
+            "tem_mais_antigos": tem_mais_antigos,
+            "tem_mais_novos": tem_mais_novos,
+        }
+    
+    chave = sorted(filtros.items()) + [("after_id", after_id), ("before_id", before_id)]
+    return json_condicional(api_etag("registros", versao_leitura(), chave), gerar)
+
+# ==================== PRESENÇA (VEÍCULOS DENTRO) ====================
+
+def get_presenca_dados(conn):
+    """Veículos no pátio e contagens por destino e empresa, lidos de 'presenca'"""
+    veiculos = conn.execute(
+        "SELECT * FROM presenca ORDER BY entrada_ts, registro_id"
+    ).fetchall()
+    por_destino = conn.execute(
+        "SELECT destino, count(*) AS total FROM presenca GROUP BY destino ORDER BY total DESC, destino"
+    ).fetchall()
+    por_empresa = conn.execute(
+        "SELECT empresa, count(*) AS total FROM presenca GROUP BY empresa ORDER BY total DESC, empresa"
+    ).fetchall()
+    return {
+        "total": len(veiculos),
+        "veiculos": [dict(v) for v in veiculos],
+        "por_destino": [dict(d) for d in por_destino],
+        "por_empresa": [dict(e) for e in por_empresa],
+    }
+
+def buscar_presenca_placa(conn, placa):
+    """Entradas em aberto da placa (qualquer formato: ABC-1234, abc1c34...)"""
+    return [dict(r) for r in conn.execute(
+        "SELECT * FROM presenca WHERE placa_chave = ? ORDER BY registro_id DESC", (placa_chave(placa),)
+    )]
+
+@app.route("/presenca")
+@login_required
+def presenca():
+    """Quem está dentro agora: lista para evacuação e conferência de fim de dia"""
+    if not check_permission("libconsulta"):
+        flash("Você não tem permissão para consultar registros!", "error")
+        return redirect(url_for("dashboard"))
     
-    if placa:
-        query += " AND placa LIKE ?"
-        params.append(f"%{placa}%")
+    placa = request.args.get("placa", "").strip()
+    conn = get_db_connection()
+    dados = get_presenca_dados(conn)
+    resultado_placa = buscar_presenca_placa(conn, placa) if placa else None
+    conn.close()
     
-    if data_inicio:
-        query += " AND data_entrada >= ?"
-        params.append(data_inicio)
+    return render_template("presenca.html", placa=placa, resultado_placa=resultado_placa,
+                           gerado_em=datetime.now(), **dados)
+
+@app.route("/api/presenca")
+@login_required
+def api_presenca():
+    if not check_permission("libconsulta"):
+        return jsonify(erro="Você não tem permissão para consultar registros!"), 403
     
-    if data_fim:
-        query += " AND data_entrada <= ?"
-        params.append(data_fim)
+    return json_condicional(api_etag("presenca"), lambda: get_presenca_dados(get_db_connection()))
+
+@app.route("/api/presenca/<placa>")
+@login_required
+def api_presenca_placa(placa):
+    """A placa está dentro? Busca pela chave normalizada em 'presenca'"""
+    if not check_permission("libconsulta"):
+        return jsonify(erro="Você não tem permissão para consultar registros!"), 403
     
-    if status == "dentro":
-        query += " AND (data_saida = \"\" OR data_saida IS NULL)"
-    elif status == "saiu":
-        query += " AND data_saida != \"\" AND data_saida IS NOT NULL"
+    registros = buscar_presenca_placa(get_db_connection(), placa)
+    return jsonify(placa=placa, placa_chave=placa_chave(placa), dentro=bool(registros), registros=registros)
+
+# ==================== PLACAS (AUTOCOMPLETAR E PREENCHIMENTO) ====================
+
+PLACA_SUGESTOES = 10
+PREFILL_CAMPOS = ("destino", "tipo", "empresa", "nome", "rg", "veiculo", "placa", "cr")
+
+# Percorre as chaves distintas do prefixo pulando de uma para a próxima no
+# índice (placa_chave, id), em vez de ler todas as linhas de cada placa, e
+# traz o registro mais recente de cada uma
+SUGESTOES_PLACA_SQL = """
+    WITH RECURSIVE chaves(chave) AS (
+        SELECT (SELECT min(placa_chave) FROM controle WHERE placa_chave >= :inicio AND placa_chave < :fim)
+        UNION ALL
+        SELECT (SELECT min(placa_chave) FROM controle WHERE placa_chave > chave AND placa_chave < :fim)
+        FROM chaves WHERE chave IS NOT NULL
+        LIMIT :limite
+    )
+    SELECT c.* FROM chaves
+    JOIN controle c ON c.id = (SELECT max(id) FROM controle WHERE placa_chave = chaves.chave)
+"""
+
+def registro_prefill(registro):
+    """Campos do último registro da placa para preencher o formulário de entrada"""
+    dados = {campo: registro[campo] for campo in PREFILL_CAMPOS}
+    dados.update(placa_chave=registro["placa_chave"], ultimo_id=registro["id"],
+                 ultima_entrada=registro["data_entrada"], ultima_hora=registro["hora_entrada"])
+    return dados
+
+@app.route("/api/placas")
+@login_required
+def api_placas():
+    """Autocompletar de placas por prefixo (qualquer formato), com o último registro de cada"""
+    if not check_permission("libinserir"):
+        return jsonify(erro="Você não tem permissão para inserir registros!"), 403
     
-    query += " ORDER BY id DESC LIMIT 100"
+    prefixo = placa_chave(request.args.get("q", ""))
+    if len(prefixo) < 2:
+        return jsonify(q=prefixo, sugestoes=[])
     
-    registros = conn.execute(query, params).fetchall()
-    conn.close()
+    conn = get_db_connection()
+    registros = conn.execute(SUGESTOES_PLACA_SQL, {
+        "inicio": prefixo,
+        "fim": prefixo[:-1] + chr(ord(prefixo[-1]) + 1),
+        "limite": PLACA_SUGESTOES,
+    }).fetchall()
+    return jsonify(q=prefixo, sugestoes=[registro_prefill(r) for r in registros])
+
+@app.route("/api/placas/<placa>")
+@login_required
+def api_placa_prefill(placa):
+    """Último registro da placa (visitante recorrente) e se ela já está no pátio"""
+    if not check_permission("libinserir"):
+        return jsonify(erro="Você não tem permissão para inserir registros!"), 403
     
-    return render_template("consultar.html", 
-                         registros=registros,
-                         empresa=empresa,
-                         nome=nome,
-                         placa=placa,
-                         data_inicio=data_inicio,
-                         data_fim=data_fim,
-                         status=status)
+    conn = get_db_connection()
+    registro = conn.execute(
+        "SELECT * FROM controle WHERE placa_chave = ? ORDER BY id DESC LIMIT 1", (placa_chave(placa),)
+    ).fetchone()
+    if registro is None:
+        return jsonify(erro="Placa sem registros anteriores", placa_chave=placa_chave(placa)), 404
+    
+    dados = registro_prefill(registro)
+    dados["dentro"] = bool(buscar_presenca_placa(conn, placa))
+    return jsonify(dados)
+
+@app.route("/eventos")
+@login_required
+def eventos_stream():
+    """Feed ao vivo (Server-Sent Events) de entradas, saídas, alterações e exclusões"""
+    try:
+        sub = broker.subscribe(request.headers.get("Last-Event-ID", type=int))
+    except TooManySubscribers:
+        # A tela continua funcionando pelo polling da API
+        return Response("Muitas telas ao vivo conectadas", status=503, headers={"Retry-After": "30"})
+    
+    return Response(broker.stream(sub), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+@app.route("/consultar/exportar/<formato>")
+@login_required
+def exportar_consulta(formato):
+    """Exporta todos os registros dos filtros da consulta, em streaming"""
+    if not check_permission("libconsulta"):
+        flash("Você não tem permissão para consultar registros!", "error")
+        return redirect(url_for("dashboard"))
+    
+    if formato not in EXPORT_FORMATS:
+        abort(404)
+    gerador, mimetype, extensao = EXPORT_FORMATS[formato]
+    
+    filtros = get_consulta_filtros(request.args)
+    ultima_escrita = session.get("ultima_escrita", 0)
+    
+    def generate():
+        # Conexão própria: a resposta continua sendo gerada depois que a rota retorna
+        with replica.acquire(ultima_escrita=ultima_escrita) as conn:
+            partes = []
+            params = []
+            for esquema in consulta_fontes(conn, filtros):
+                where, where_params = build_consulta_where(filtros, esquema)
+                partes.append(f"SELECT {EXPORT_SELECT} FROM {esquema}.controle WHERE {where}")
+                params += where_params
+            cursor = conn.execute(" UNION ALL ".join(partes) + " ORDER BY id DESC", params)
+            try:
+                yield from gerador(cursor)
+            finally:
+                cursor.close()
+    
+    nome_arquivo = f"registros_{datetime.now().strftime('%Y%m%d_%H%M')}.{extensao}"
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f'attachment; filename="{nome_arquivo}"',
+            "X-Accel-Buffering": "no",
+        },
+    )
 
 @app.route("/editar_registro/<int:id>")
 @login_required
@@ -520,11 +1443,12 @@ def editar_registro(id):
     
     conn = get_db_connection()
     registro = conn.execute("SELECT * FROM controle WHERE id = ?", (id,)).fetchone()
-    conn.close()
     
     if not registro:
-        flash("Registro não encontrado!", "error")
+        registro_ausente(conn, id)
+        conn.close()
         return redirect(url_for("consultar"))
+    conn.close()
     
     return render_template("editar_registro.html", registro=registro)
 
@@ -556,7 +1480,7 @@ def atualizar_registro(id):
     
     try:
         conn = get_db_connection()
-        conn.execute("""
+        cursor = conn.execute("""
             UPDATE controle SET
                 destino = ?, tipo = ?, empresa = ?, nome = ?, rg = ?, veiculo = ?, placa = ?, cr = ?,
                 data_entrada = ?, data_saida = ?, hora_entrada = ?, hora_saida = ?,
@@ -568,9 +1492,12 @@ def atualizar_registro(id):
             n_nota, obs, periodoalterado, usuarioalterado, data_alterada, id
         ))
         conn.commit()
-        conn.close()
         
-        flash("Registro atualizado com sucesso!", "success")
+        if cursor.rowcount:
+            flash("Registro atualizado com sucesso!", "success")
+        else:
+            registro_ausente(conn, id)
+        conn.close()
         return redirect(url_for("consultar"))
         
     except Exception as e:
@@ -586,11 +1513,14 @@ def excluir_registro(id):
     
     try:
         conn = get_db_connection()
-        conn.execute("DELETE FROM controle WHERE id = ?", (id,))
+        cursor = conn.execute("DELETE FROM controle WHERE id = ?", (id,))
         conn.commit()
-        conn.close()
         
-        flash("Registro excluído com sucesso!", "success")
+        if cursor.rowcount:
+            flash("Registro excluído com sucesso!", "success")
+        else:
+            registro_ausente(conn, id)
+        conn.close()
         
     except Exception as e:
         flash(f"Erro ao excluir registro: {str(e)}", "error")
@@ -611,16 +1541,16 @@ def registrar_saida(id):
     data_alterada = datetime.now().strftime("%Y-%m-%d")
     
     try:
-        conn = get_db_connection()
-        conn.execute("""
+        _, alterados = writer.execute("""
             UPDATE controle SET
                 data_saida = ?, hora_saida = ?, periodoalterado = ?, usuarioalterado = ?, data_alterada = ?
             WHERE id = ?
         """, (data_saida, hora_saida, periodoalterado, usuarioalterado, data_alterada, id))
-        conn.commit()
-        conn.close()
         
-        flash("Saída registrada com sucesso!", "success")
+        if alterados:
+            flash("Saída registrada com sucesso!", "success")
+        else:
+            registro_ausente(get_db_connection(), id)
         
     except Exception as e:
         flash(f"Erro ao registrar saída: {str(e)}", "error")
@@ -628,5 +1558,9 @@ def registrar_saida(id):
     return redirect(url_for("consultar"))
 
 if __name__ == "__main__":
+    if "--precompile-templates" in sys.argv[1:]:
+        total = precompile_templates()
+        print(f"✓ {total} templates compilados em {JINJA_CACHE_DIR}")
+        sys.exit(0)
     init_db()
     app.run(debug=False, host="0.0.0.0", port=5000)
\ No newline at end of file
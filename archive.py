@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Arquivo anual das movimentações antigas de 'controle'.
+
+Movimentações encerradas com entrada anterior ao corte (ARQUIVO_MESES meses
+atrás, no início do mês) saem do banco principal e vão para um arquivo
+SQLite por ano de entrada (ARQUIVO_DIR/controle_AAAA.db), com as mesmas
+colunas, os mesmos índices e a busca textual. O banco principal fica com o
+período recente e os veículos ainda dentro, qualquer que seja a idade.
+
+Contadores, 'resumo_diario' e o feed de eventos não mudam ao arquivar (os
+triggers de exclusão respeitam a marca 'arquivando'), então dashboard e
+relatórios continuam contando o histórico. ``fontes`` anexa à conexão os
+arquivos que um período alcança; a consulta e os relatórios juntam o banco
+principal e esses arquivos com UNION ALL.
+
+Uso: python3 archive.py [--meses 12] [--dry-run] [--vacuum]
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import sys
+from datetime import date
+
+import db
+import eventos
+from datas import de_epoch, para_epoch, timestamp_sql
+from placas import placa_chave_sql
+from setup_database_bcrypt import FTS_COLUMNS, fts_values
+
+ARQUIVO_DIR = os.environ.get(
+    "ARQUIVO_DIR", os.path.join(os.path.dirname(os.path.abspath(db.DATABASE)), "arquivo")
+)
+ARQUIVO_MESES = int(os.environ.get("ARQUIVO_MESES", "12"))
+ARQUIVO_LOTE = int(os.environ.get("ARQUIVO_LOTE", "2000"))
+
+# Colunas geradas de 'controle': no arquivo são recriadas com a mesma expressão
+COLUNAS_GERADAS = {
+    "placa_chave": placa_chave_sql("placa"),
+    "entrada_ts": timestamp_sql("data_entrada", "hora_entrada"),
+    "saida_ts": timestamp_sql("data_saida", "hora_saida"),
+}
+
+_NOME_ARQUIVO = re.compile(r"controle_(\d{4})\.db")
+
+
+def caminho_arquivo(ano):
+    return os.path.join(ARQUIVO_DIR, f"controle_{ano}.db")
+
+
+def esquema_arquivo(ano):
+    return f"arquivo_{ano}"
+
+
+def anos_arquivados():
+    """Anos que já têm arquivo em ARQUIVO_DIR, em ordem"""
+    try:
+        nomes = os.listdir(ARQUIVO_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted(int(m.group(1)) for m in map(_NOME_ARQUIVO.fullmatch, nomes) if m)
+
+
+def corte(conn):
+    """Instante de corte: entradas anteriores podem estar no arquivo (0 sem arquivo)"""
+    row = conn.execute("SELECT valor FROM contadores WHERE chave = 'arquivado_ate'").fetchone()
+    return row[0] if row else 0
+
+
+def anos_no_periodo(conn, inicio, fim=None):
+    """Anos arquivados que o período [inicio, fim) alcança; [] se ele começa depois do corte.
+
+    Sem ``inicio`` a consulta fica no banco principal. O SQLite anexa no
+    máximo SQLITE_LIMIT_ATTACHED bancos (10 por padrão): ficam os mais recentes.
+    """
+    ts_corte = corte(conn)
+    if inicio is None or not ts_corte or inicio >= ts_corte:
+        return []
+    ultimo = de_epoch(min(fim or ts_corte, ts_corte) - 1).year
+    anos = [ano for ano in anos_arquivados() if de_epoch(inicio).year <= ano <= ultimo]
+    return anos[-conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED):]
+
+
+def anexar(conn, anos):
+    """Anexa à conexão os arquivos dos ``anos`` (os já anexados ficam); devolve os esquemas.
+
+    Arquivos de outros anos são desanexados se faltar vaga.
+    """
+    raw = getattr(conn, "raw", conn)
+    anexados = {row[1] for row in raw.execute("PRAGMA database_list")} - {"main", "temp"}
+    esquemas = [esquema_arquivo(ano) for ano in anos]
+    faltando = [(ano, esquema) for ano, esquema in zip(anos, esquemas) if esquema not in anexados]
+    if faltando:
+        livres = raw.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) - len(anexados)
+        sobrando = sorted(nome for nome in anexados if nome.startswith("arquivo_") and nome not in esquemas)
+        for nome in sobrando[:max(0, len(faltando) - livres)]:
+            raw.execute(f"DETACH DATABASE {nome}")
+        for ano, esquema in faltando:
+            raw.execute(f"ATTACH DATABASE ? AS {esquema}", (caminho_arquivo(ano),))
+    return esquemas
+
+
+def fontes(conn, inicio, fim=None):
+    """Esquemas que contêm as entradas de [inicio, fim): 'main' e os arquivos do período"""
+    return ["main"] + anexar(conn, anos_no_periodo(conn, inicio, fim))
+
+
+# ==================== ARQUIVAMENTO ====================
+
+def colunas_controle(conn):
+    """(nome, tipo) das colunas de 'controle' no banco principal, na ordem da tabela"""
+    return [(row[1], row[2]) for row in conn.execute("PRAGMA main.table_xinfo(controle)")]
+
+
+def criar_arquivo(conn, esquema):
+    """Cria em ``esquema`` a tabela 'controle' com as colunas, índices e busca do banco principal"""
+    definicoes = []
+    for nome, tipo in colunas_controle(conn):
+        if nome == "id":
+            definicoes.append("id INTEGER PRIMARY KEY")
+        elif nome in COLUNAS_GERADAS:
+            definicoes.append(f"{nome} {tipo} GENERATED ALWAYS AS ({COLUNAS_GERADAS[nome]}) VIRTUAL")
+        else:
+            definicoes.append(f"{nome} {tipo} NOT NULL")
+    conn.execute(f"PRAGMA {esquema}.journal_mode = WAL")
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {esquema}.controle ({', '.join(definicoes)})")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {esquema}.idx_controle_entrada_saida ON controle(entrada_ts, saida_ts)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {esquema}.idx_controle_placa_chave ON controle(placa_chave, id)")
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {esquema}.controle_fts USING fts5(
+            {', '.join(FTS_COLUMNS)},
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    """)
+
+
+def data_corte(meses, hoje=None):
+    """Primeiro dia do mês ``meses`` meses antes de ``hoje``"""
+    hoje = hoje or date.today()
+    total = hoje.year * 12 + hoje.month - 1 - meses
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def mover_lote(conn, esquema, ids, ts_corte):
+    """Copia ``ids`` para o arquivo e depois os remove do banco principal.
+
+    São duas transações: se o processo cair entre elas, as linhas ficam nos
+    dois bancos e a próxima execução termina a remoção (a cópia ignora o que
+    já está no arquivo). Nenhuma linha sai do principal sem estar no arquivo.
+    """
+    marcadores = ",".join("?" * len(ids))
+    colunas = ", ".join(nome for nome, _ in colunas_controle(conn) if nome not in COLUNAS_GERADAS)
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(f"""
+            INSERT INTO {esquema}.controle_fts(rowid, {', '.join(FTS_COLUMNS)})
+            SELECT id, {fts_values('c')} FROM main.controle c
+            WHERE id IN ({marcadores}) AND id NOT IN (SELECT id FROM {esquema}.controle)
+        """, ids)
+        conn.execute(f"""
+            INSERT OR IGNORE INTO {esquema}.controle ({colunas})
+            SELECT {colunas} FROM main.controle WHERE id IN ({marcadores})
+        """, ids)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("UPDATE main.contadores SET valor = max(valor, ?) WHERE chave = 'arquivado_ate'", (ts_corte,))
+        conn.execute("UPDATE main.contadores SET valor = 1 WHERE chave = 'arquivando'")
+        removidos = conn.execute(f"""
+            DELETE FROM main.controle
+            WHERE id IN ({marcadores}) AND id IN (SELECT id FROM {esquema}.controle)
+        """, ids).rowcount
+        conn.execute("UPDATE main.contadores SET valor = 0 WHERE chave = 'arquivando'")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return removidos
+
+
+def arquivar(meses=ARQUIVO_MESES, lote=ARQUIVO_LOTE, dry_run=False, vacuum=False, hoje=None):
+    """Move para os arquivos anuais as movimentações encerradas com entrada antes do corte"""
+    dia_corte = data_corte(meses, hoje)
+    ts_corte = para_epoch(dia_corte)
+    conn = db.connect()
+    conn.isolation_level = None
+    pendentes = """
+        SELECT id, entrada_ts FROM controle
+        WHERE entrada_ts < ? AND data_saida != '' ORDER BY entrada_ts LIMIT ?
+    """
+
+    if dry_run:
+        anos = conn.execute("""
+            SELECT strftime('%Y', data_entrada), count(*) FROM controle
+            WHERE entrada_ts < ? AND data_saida != '' GROUP BY 1
+        """, (ts_corte,)).fetchall()
+        print(f"Corte: entradas antes de {dia_corte.strftime('%d/%m/%Y')}")
+        for ano, total in anos:
+            print(f"  {ano}: {total} registro(s) seriam arquivados em {caminho_arquivo(ano)}")
+        conn.close()
+        return {int(ano): total for ano, total in anos}
+
+    os.makedirs(ARQUIVO_DIR, exist_ok=True)
+    movidos = {}
+    while True:
+        rows = conn.execute(pendentes, (ts_corte, lote)).fetchall()
+        if not rows:
+            break
+        por_ano = {}
+        for id, entrada_ts in rows:
+            por_ano.setdefault(de_epoch(entrada_ts).year, []).append(id)
+        for ano, ids in por_ano.items():
+            esquema = anexar(conn, [ano])[0]
+            criar_arquivo(conn, esquema)
+            movidos[ano] = movidos.get(ano, 0) + mover_lote(conn, esquema, ids, ts_corte)
+
+    for ano, total in sorted(movidos.items()):
+        print(f"✓ {ano}: {total} registro(s) arquivados em {caminho_arquivo(ano)}")
+    if not movidos:
+        print(f"✓ Nada a arquivar antes de {dia_corte.strftime('%d/%m/%Y')}.")
+    removidos = eventos.prune(conn)
+    if removidos:
+        print(f"✓ {removidos} evento(s) antigo(s) removidos do feed ao vivo.")
+    if vacuum:
+        conn.execute("VACUUM main")
+        print("✓ Banco principal compactado (VACUUM).")
+    conn.close()
+    return movidos
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Arquiva movimentações antigas de 'controle' por ano")
+    parser.add_argument('--meses', type=int, default=ARQUIVO_MESES,
+                        help="meses mantidos no banco principal, além do mês atual")
+    parser.add_argument('--lote', type=int, default=ARQUIVO_LOTE, help="registros movidos por transação")
+    parser.add_argument('--dry-run', action='store_true', help="apenas conta o que seria arquivado")
+    parser.add_argument('--vacuum', action='store_true', help="devolve ao disco o espaço liberado")
+    args = parser.parse_args()
+
+    if not os.path.exists(db.DATABASE):
+        print(f"❌ Arquivo '{db.DATABASE}' não encontrado!")
+        print("   Execute: python3 setup_database_bcrypt.py")
+        sys.exit(1)
+
+    arquivar(args.meses, args.lote, args.dry_run, args.vacuum)
@@ -0,0 +1,222 @@
+"""
+Modo de servir assíncrono (ASGI), alternativo ao gunicorn gthread.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 8000 --workers 2
+
+As rotas do Flask continuam síncronas: sqlite3 e bcrypt são chamadas C que
+bloqueiam, e um driver "assíncrono" de SQLite só as levaria para uma thread.
+Elas rodam em um pool de ASGI_THREADS threads, e o corpo da resposta é
+enviado em partes conforme é gerado (exportações continuam em streaming).
+O que passa quase todo o tempo só esperando roda direto no loop de eventos,
+sem ocupar thread:
+
+- /eventos: cada tela do feed ao vivo é uma corrotina esperando o broker.
+  O limite por worker passa a ser ASGI_SSE_MAX_CLIENTS, e as telas não
+  disputam as threads das rotas da portaria.
+"""
+
+import asyncio
+import io
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app
+from eventos import SSE_HEARTBEAT, AsyncSubscription, TooManySubscribers, broker, format_event
+
+ASGI_THREADS = int(os.environ.get("ASGI_THREADS", "64"))
+ASGI_SSE_MAX_CLIENTS = int(os.environ.get("ASGI_SSE_MAX_CLIENTS", "1000"))
+
+# As telas não ocupam threads neste modo
+broker.max_clients = ASGI_SSE_MAX_CLIENTS
+
+
+def build_environ(scope, body):
+    """Ambiente WSGI (PEP 3333) de uma requisição HTTP do ASGI"""
+    servidor = scope.get("server") or ("localhost", 80)
+    cliente = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": servidor[0],
+        "SERVER_PORT": str(servidor[1]),
+        "SERVER_PROTOCOL": "HTTP/%s" % scope.get("http_version", "1.1"),
+        "REMOTE_ADDR": cliente[0],
+        "REMOTE_PORT": str(cliente[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for nome, valor in scope.get("headers", []):
+        nome = nome.decode("latin-1").upper().replace("-", "_")
+        valor = valor.decode("latin-1")
+        if nome == "CONTENT_TYPE" or nome == "CONTENT_LENGTH":
+            chave = nome
+        else:
+            chave = "HTTP_" + nome
+        if chave in environ:
+            valor = environ[chave] + ("; " if chave == "HTTP_COOKIE" else ",") + valor
+        environ[chave] = valor
+    return environ
+
+
+async def read_body(receive):
+    partes = []
+    while True:
+        mensagem = await receive()
+        if mensagem["type"] == "http.disconnect":
+            return None
+        partes.append(mensagem.get("body", b""))
+        if not mensagem.get("more_body"):
+            return b"".join(partes)
+
+
+async def wait_disconnect(receive, aviso):
+    """Espera o cliente desconectar e chama ``aviso()``"""
+    while (await receive())["type"] != "http.disconnect":
+        pass
+    aviso()
+
+
+class WsgiBridge:
+    """Roda o app WSGI em um pool de threads e repassa a resposta ao servidor ASGI.
+
+    Cada parte do corpo só é gerada depois que a anterior foi entregue ao
+    servidor, então uma exportação grande não se acumula em memória. Se o
+    cliente desconectar, a geração para na parte seguinte.
+    """
+
+    def __init__(self, wsgi_app, threads=ASGI_THREADS):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix="asgi-wsgi")
+
+    async def __call__(self, scope, receive, send):
+        body = await read_body(receive)
+        if body is None:
+            return
+        loop = asyncio.get_running_loop()
+        desconectou = threading.Event()
+        vigia = asyncio.create_task(wait_disconnect(receive, desconectou.set))
+        try:
+            await loop.run_in_executor(
+                self.executor, self.run, build_environ(scope, body), loop, send, desconectou
+            )
+        finally:
+            vigia.cancel()
+
+    def run(self, environ, loop, send, desconectou):
+        resposta = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and resposta.get("enviada"):
+                raise exc_info[1].with_traceback(exc_info[2])
+            resposta["status"] = int(status.split(" ", 1)[0])
+            resposta["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+
+        def enviar(*mensagens):
+            # Uma só passagem pelo loop para início + corpo de respostas pequenas
+            asyncio.run_coroutine_threadsafe(send_all(send, mensagens), loop).result()
+
+        def inicio():
+            if resposta.get("enviada"):
+                return ()
+            resposta["enviada"] = True
+            return ({"type": "http.response.start", "status": resposta["status"], "headers": resposta["headers"]},)
+
+        corpo = self.wsgi_app(environ, start_response)
+        try:
+            # Cada parte só vai quando a próxima existe: a última sai com more_body=False
+            anterior = None
+            for parte in corpo:
+                if desconectou.is_set():
+                    return
+                if not parte:
+                    continue
+                if anterior is not None:
+                    enviar(*inicio(), {"type": "http.response.body", "body": anterior, "more_body": True})
+                anterior = parte
+            enviar(*inicio(), {"type": "http.response.body", "body": anterior or b"", "more_body": False})
+        finally:
+            if hasattr(corpo, "close"):
+                corpo.close()
+
+
+async def send_all(send, mensagens):
+    for mensagem in mensagens:
+        await send(mensagem)
+
+
+async def eventos_stream(scope, receive, send, last_event_id):
+    """/eventos como corrotina: mesmo protocolo da rota do Flask"""
+    sub = AsyncSubscription(asyncio.get_running_loop())
+    try:
+        broker.subscribe(last_event_id, sub)
+    except TooManySubscribers:
+        await send({"type": "http.response.start", "status": 503, "headers": [
+            (b"content-type", b"text/plain; charset=utf-8"), (b"retry-after", b"30")]})
+        await send({"type": "http.response.body", "body": "Muitas telas ao vivo conectadas".encode("utf-8")})
+        return
+
+    vigia = asyncio.create_task(wait_disconnect(receive, sub.fechar))
+    try:
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"text/event-stream; charset=utf-8"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+        ]})
+        await send({"type": "http.response.body", "body": b"retry: 5000\n\n", "more_body": True})
+        while not sub.fechada:
+            eventos = await sub.get(SSE_HEARTBEAT)
+            if sub.fechada:
+                break
+            texto = "".join(format_event(evento) for evento in eventos) if eventos else ": ping\n\n"
+            await send({"type": "http.response.body", "body": texto.encode("utf-8"), "more_body": True})
+    finally:
+        broker.unsubscribe(sub)
+        vigia.cancel()
+
+
+def sessao_logada(scope):
+    """Sessão do Flask (cookie assinado) da requisição, se o usuário estiver logado"""
+    request = app.request_class(build_environ(scope, b""))
+    sessao = app.session_interface.open_session(app, request)
+    return request, sessao if sessao is not None and "username" in sessao else None
+
+
+async def lifespan(receive, send):
+    while True:
+        mensagem = await receive()
+        if mensagem["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif mensagem["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+class PortariaASGI:
+    def __init__(self, wsgi_app):
+        self.wsgi = WsgiBridge(wsgi_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        if scope["path"] == "/eventos" and scope["method"] == "GET":
+            request, sessao = sessao_logada(scope)
+            # Sem login, o Flask responde (redireciona para o login)
+            if sessao is not None:
+                await eventos_stream(scope, receive, send, request.headers.get("Last-Event-ID", type=int))
+                return
+        await self.wsgi(scope, receive, send)
+
+
+application = PortariaASGI(app)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Compara o modo síncrono (gunicorn gthread, app:app) com o modo ASGI
+(uvicorn, asgi:application) sob a mesma carga.
+
+Em cada modo: abre --screens telas no /eventos e as mantém conectadas, e
+então --clients clientes concorrentes fazem requisições às rotas de leitura
+da portaria (/api/dashboard e /api/registros) durante --duration segundos.
+Mede as telas aceitas/recusadas, as requisições por segundo e a latência.
+
+Uso:
+    python3 benchmarks/bench_asgi.py --db /tmp/bench.db --screens 100 --clients 32
+    python3 benchmarks/bench_asgi.py --db /tmp/bench.db --modes asgi --workers 2
+"""
+
+import argparse
+import http.client
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from bench_sse import free_port, login, wait_for_server
+from common import ROOT, create_bench_users, percentile, prepare_schema, use_database
+
+ROTAS = ("/api/dashboard", "/api/registros")
+
+
+def server_command(modo, host, port, args):
+    if modo == "sync":
+        return [sys.executable, "-m", "gunicorn", "--worker-class", "gthread",
+                "--threads", str(args.threads), "--workers", str(args.workers),
+                "--bind", f"{host}:{port}", "--graceful-timeout", "2", "--log-level", "warning", "app:app"]
+    return [sys.executable, "-m", "uvicorn", "asgi:application", "--host", host, "--port", str(port),
+            "--workers", str(args.workers), "--log-level", "warning", "--timeout-graceful-shutdown", "2"]
+
+
+def hold_screen(host, port, cookie, estado, lock, parar):
+    """Uma tela parada no /eventos até o fim do teste"""
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+    try:
+        conn.request("GET", "/eventos", headers={"Cookie": cookie, "Accept": "text/event-stream"})
+        resposta = conn.getresponse()
+        with lock:
+            estado["telas"][resposta.status] = estado["telas"].get(resposta.status, 0) + 1
+        if resposta.status != 200:
+            resposta.read()
+            return
+        resposta.fp.readline()
+        parar.wait()
+    except (OSError, http.client.HTTPException):
+        with lock:
+            estado["telas"]["erro"] = estado["telas"].get("erro", 0) + 1
+    finally:
+        conn.close()
+
+
+def run_client(host, port, cookie, fim, latencias, estado, lock):
+    """Um cliente: requisições em sequência, com keep-alive, até ``fim``"""
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    n = 0
+    while time.perf_counter() < fim:
+        rota = ROTAS[n % len(ROTAS)]
+        n += 1
+        inicio = time.perf_counter()
+        try:
+            conn.request("GET", rota, headers={"Cookie": cookie})
+            resposta = conn.getresponse()
+            resposta.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+            with lock:
+                estado["erros"] += 1
+            continue
+        duracao = time.perf_counter() - inicio
+        with lock:
+            if resposta.status == 200:
+                latencias.append(duracao)
+            else:
+                estado["erros"] += 1
+    conn.close()
+
+
+def run_mode(modo, db_path, cookies_usuarios, args):
+    host, port = "127.0.0.1", free_port()
+    ambiente = dict(os.environ, PORTARIA_DB=db_path)
+    servidor = subprocess.Popen(server_command(modo, host, port, args), cwd=ROOT, env=ambiente)
+    lock = threading.Lock()
+    parar = threading.Event()
+    estado = {"telas": {}, "erros": 0}
+    latencias = []
+    try:
+        wait_for_server(host, port)
+        cookies = [login(host, port, username) for username in cookies_usuarios]
+
+        telas = [
+            threading.Thread(target=hold_screen, daemon=True,
+                             args=(host, port, cookies[i % len(cookies)], estado, lock, parar))
+            for i in range(args.screens)
+        ]
+        for t in telas:
+            t.start()
+        limite = time.monotonic() + 30
+        while time.monotonic() < limite:
+            with lock:
+                if sum(estado["telas"].values()) >= args.screens:
+                    break
+            time.sleep(0.1)
+
+        inicio = time.perf_counter()
+        fim = inicio + args.duration
+        clientes = [
+            threading.Thread(target=run_client, daemon=True,
+                             args=(host, port, cookies[i % len(cookies)], fim, latencias, estado, lock))
+            for i in range(args.clients)
+        ]
+        for t in clientes:
+            t.start()
+        for t in clientes:
+            t.join(timeout=args.duration + 60)
+        decorrido = time.perf_counter() - inicio
+    finally:
+        parar.set()
+        servidor.terminate()
+        try:
+            servidor.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            servidor.kill()
+
+    ms = [v * 1000 for v in latencias]
+    return {
+        "modo": modo,
+        "telas": estado["telas"].get(200, 0),
+        "recusadas": estado["telas"].get(503, 0),
+        "requisicoes": len(ms),
+        "erros": estado["erros"],
+        "rps": round(len(ms) / decorrido, 1),
+        "p50": round(percentile(ms, 50), 1),
+        "p95": round(percentile(ms, 95), 1),
+        "p99": round(percentile(ms, 99), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="banco da aplicação (padrão: arquivo temporário)")
+    parser.add_argument("--modes", default="sync,asgi", help="modos a comparar, separados por vírgula")
+    parser.add_argument("--screens", type=int, default=100, help="telas conectadas ao /eventos")
+    parser.add_argument("--clients", type=int, default=32, help="clientes concorrentes nas rotas de leitura")
+    parser.add_argument("--duration", type=float, default=15, help="segundos de carga por modo")
+    parser.add_argument("--threads", type=int, default=64, help="threads do gunicorn gthread (modo sync)")
+    parser.add_argument("--workers", type=int, default=1, help="workers de cada servidor")
+    parser.add_argument("--users", type=int, default=10, help="usuários distintos entre os clientes")
+    args = parser.parse_args()
+
+    os.environ.setdefault("BCRYPT_ROUNDS", "4")
+    db_path = use_database(args.db)
+    prepare_schema()
+    usuarios = [f"BENCH{i:03d}" for i in range(args.users)]
+    create_bench_users(usuarios, rounds=int(os.environ["BCRYPT_ROUNDS"]))
+
+    print(f"{args.screens} telas no /eventos, {args.clients} clientes por {args.duration:g}s, "
+          f"{args.workers} worker(s)")
+    for modo in args.modes.split(","):
+        r = run_mode(modo.strip(), db_path, usuarios, args)
+        print(f"{r['modo']:>5}: telas {r['telas']} (+{r['recusadas']} recusadas com 503) | "
+              f"{r['rps']} req/s, {r['requisicoes']} ok, {r['erros']} erros | "
+              f"p50 {r['p50']} ms, p95 {r['p95']} ms, p99 {r['p99']} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Benchmark do fluxo da portaria com guardas virtuais concorrentes.
+
+Cada guarda faz login e repete o ciclo
+    salvar_registro -> dashboard -> consultar (pela placa) -> registrar_saida
+contra o app real: pelo test client do Flask (padrão, em processo) ou contra
+um servidor já rodando (--url, por exemplo um gunicorn local). Ao final
+mostra a vazão e p50/p95/p99 por rota e compara com a linha de base gravada
+em benchmarks/baselines.json (versionado com o cenário padrão; regrave com
+--save-baseline na sua máquina, veja o README).
+
+Uso:
+    python3 benchmarks/seed.py --db /tmp/bench.db --rows 1000000
+    python3 benchmarks/bench_gate.py --db /tmp/bench.db --guards 16 --duration 30
+    python3 benchmarks/bench_gate.py --db /tmp/bench.db --save-baseline
+    python3 benchmarks/bench_gate.py --db /tmp/bench.db --require-baseline
+    python3 benchmarks/bench_gate.py --url http://127.0.0.1:8000 --db /tmp/bench.db
+"""
+
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import re
+import string
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import datetime
+
+from common import create_bench_users, percentile, prepare_schema, use_database
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+ROUTES = ("login", "salvar_registro", "dashboard", "consultar", "registrar_saida")
+ID_RE = re.compile(r"<td>(\d+)</td>")
+
+
+class TestClientGuard:
+    """Guarda que fala com o app em processo pelo test client"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def get(self, path):
+        r = self.client.get(path)
+        return r.status_code, r.get_data(as_text=True)
+
+    def post(self, path, data=None):
+        r = self.client.post(path, data=data or {})
+        return r.status_code, r.get_data(as_text=True)
+
+
+class HttpGuard:
+    """Guarda que fala com um servidor real por HTTP, com cookie de sessão próprio"""
+
+    class _NoRedirect(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, *args, **kwargs):
+            return None
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), self._NoRedirect()
+        )
+
+    def _open(self, request):
+        try:
+            with self.opener.open(request, timeout=60) as r:
+                return r.status, r.read().decode("utf-8", "replace")
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode("utf-8", "replace")
+
+    def get(self, path):
+        return self._open(urllib.request.Request(self.base_url + path))
+
+    def post(self, path, data=None):
+        body = urllib.parse.urlencode(data or {}).encode("utf-8")
+        return self._open(urllib.request.Request(self.base_url + path, data=body, method="POST"))
+
+
+def run_guard(guard, username, deadline, rng, resultados, erros, lock):
+    def medir(rota, fn, *args):
+        inicio = time.perf_counter()
+        status, corpo = fn(*args)
+        duracao = time.perf_counter() - inicio
+        with lock:
+            resultados[rota].append(duracao)
+            if status >= 400:
+                erros[rota] += 1
+        return status, corpo
+
+    medir("login", guard.post, "/login", {"username": username, "senha": "senha123"})
+    while time.perf_counter() < deadline:
+        placa = "BEN" + "".join(rng.choice(string.digits) for _ in range(4))
+        agora = datetime.now()
+        medir("salvar_registro", guard.post, "/salvar_registro", {
+            "destino": "Recebimento", "tipo": "Caminhão", "empresa": "Benchmark Logística",
+            "nome": f"Guarda {username}", "placa": placa,
+            "data_entrada": agora.strftime("%Y-%m-%d"), "hora_entrada": agora.strftime("%H:%M"),
+        })
+        medir("dashboard", guard.get, "/dashboard")
+        _, corpo = medir("consultar", guard.get, "/consultar?" + urllib.parse.urlencode({"placa": placa}))
+        ids = ID_RE.findall(corpo)
+        if ids:
+            medir("registrar_saida", guard.post, f"/registrar_saida/{ids[0]}")
+
+
+def run(args):
+    # Custo baixo para os usuários do benchmark: o foco é o fluxo da portaria, não o bcrypt
+    os.environ.setdefault("BCRYPT_ROUNDS", "4")
+    use_database(args.db)
+    prepare_schema()
+    usuarios = [f"BENCH{i:03d}" for i in range(args.guards)]
+    create_bench_users(usuarios, rounds=int(os.environ["BCRYPT_ROUNDS"]))
+
+    if args.url:
+        fabrica = lambda: HttpGuard(args.url)  # noqa: E731
+    else:
+        import app as app_module
+        fabrica = lambda: TestClientGuard(app_module.app)  # noqa: E731
+
+    resultados = defaultdict(list)
+    erros = defaultdict(int)
+    lock = threading.Lock()
+    inicio = time.perf_counter()
+    deadline = inicio + args.duration
+    threads = [
+        threading.Thread(target=run_guard,
+                         args=(fabrica(), username, deadline, random.Random(i), resultados, erros, lock))
+        for i, username in enumerate(usuarios)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    total = time.perf_counter() - inicio
+
+    relatorio = {"requests": sum(len(v) for v in resultados.values()), "seconds": round(total, 2), "routes": {}}
+    relatorio["throughput"] = round(relatorio["requests"] / total, 1)
+    for rota in ROUTES:
+        ms = [v * 1000 for v in resultados.get(rota, [])]
+        relatorio["routes"][rota] = {
+            "count": len(ms),
+            "errors": erros.get(rota, 0),
+            "p50": round(percentile(ms, 50), 2),
+            "p95": round(percentile(ms, 95), 2),
+            "p99": round(percentile(ms, 99), 2),
+        }
+    return relatorio
+
+
+def print_report(relatorio, baseline, tolerancia):
+    print(f"{relatorio['requests']} requisições em {relatorio['seconds']}s "
+          f"= {relatorio['throughput']} req/s"
+          + (f" (base: {baseline['throughput']} req/s)" if baseline else ""))
+    print("-" * 84)
+    print(f"{'rota':<18} {'n':>7} {'erros':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  {'vs base (p95)':>14}")
+    regressoes = []
+    for rota, r in relatorio["routes"].items():
+        comparacao = ""
+        base = (baseline or {}).get("routes", {}).get(rota)
+        if base and base["p95"]:
+            variacao = (r["p95"] - base["p95"]) / base["p95"]
+            comparacao = f"{variacao:+.0%}"
+            if variacao > tolerancia:
+                comparacao += " ⚠"
+                regressoes.append(rota)
+        print(f"{rota:<18} {r['count']:>7} {r['errors']:>6} {r['p50']:>9.1f} {r['p95']:>9.1f} "
+              f"{r['p99']:>9.1f}  {comparacao:>14}")
+    print("-" * 84)
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", required=True, help="banco já populado com benchmarks/seed.py")
+    parser.add_argument("--url", help="servidor a testar (padrão: test client em processo)")
+    parser.add_argument("--guards", type=int, default=8, help="guardas virtuais simultâneos")
+    parser.add_argument("--duration", type=float, default=20, help="segundos de carga")
+    parser.add_argument("--scenario", default=None, help="nome da linha de base (padrão: derivado dos parâmetros)")
+    parser.add_argument("--save-baseline", action="store_true", help="grava o resultado como nova linha de base")
+    parser.add_argument("--require-baseline", action="store_true",
+                        help="termina com erro se o cenário não tiver linha de base")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="piora de p95 aceita antes de acusar regressão")
+    args = parser.parse_args()
+
+    modo = "http" if args.url else "testclient"
+    cenario = args.scenario or f"{modo}-{args.guards}guards"
+    baselines = {}
+    if os.path.exists(BASELINES):
+        with open(BASELINES, encoding="utf-8") as f:
+            baselines = json.load(f)
+
+    relatorio = run(args)
+    print(f"Cenário: {cenario}")
+    baseline = baselines.get(cenario)
+    if baseline is None and not args.save_baseline:
+        print("!" * 84)
+        print(f"⚠ SEM LINHA DE BASE para '{cenario}' em {BASELINES}: nada foi comparado.")
+        print(f"  Cenários gravados: {', '.join(sorted(baselines)) or 'nenhum'}")
+        print("  Grave uma com --save-baseline (na mesma máquina e no mesmo banco) antes da mudança.")
+        print("!" * 84)
+    regressoes = print_report(relatorio, baseline, args.tolerance)
+
+    if args.save_baseline:
+        relatorio["recorded_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        relatorio["duration"] = args.duration
+        baselines[cenario] = relatorio
+        with open(BASELINES, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2, ensure_ascii=False, sort_keys=True)
+        print(f"✓ Linha de base '{cenario}' gravada em {BASELINES}")
+    elif baseline is None and args.require_baseline:
+        sys.exit(2)
+    elif regressoes:
+        print(f"⚠ Regressão de p95 acima de {args.tolerance:.0%} em: {', '.join(regressoes)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark de login sob carga concorrente.
+
+Cria um banco temporário com usuários bcrypt e dispara logins simultâneos
+pelo test client do Flask, cada "guarda" em sua própria thread (como um
+worker gthread do gunicorn). Compara o pool de hashing limitado com um pool
+sem limite de fila e mostra p50/p95/p99 e quantos logins foram recusados
+com "tente novamente".
+
+Uso:
+    python3 benchmarks/bench_login.py --concurrency 32 --logins 8 --rounds 10
+"""
+
+import argparse
+import os
+import threading
+import time
+
+from common import create_bench_users, percentile, prepare_schema, use_database
+
+
+def run_round(app_module, usuarios, concurrency, logins, workers, max_pending):
+    import passwords
+    passwords.hashing_pool = passwords.HashingPool(workers=workers, max_pending=max_pending)
+
+    latencias = []
+    recusados = 0
+    lock = threading.Lock()
+    barreira = threading.Barrier(concurrency)
+
+    def guarda(i):
+        nonlocal recusados
+        client = app_module.app.test_client()
+        username = usuarios[i % len(usuarios)]
+        barreira.wait()
+        for _ in range(logins):
+            inicio = time.perf_counter()
+            r = client.post("/login", data={"username": username, "senha": "senha123"})
+            duracao = time.perf_counter() - inicio
+            with lock:
+                latencias.append(duracao)
+                if not r.location or not r.location.endswith("/dashboard"):
+                    recusados += 1
+            client.get("/logout")
+
+    threads = [threading.Thread(target=guarda, args=(i,)) for i in range(concurrency)]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    total = time.perf_counter() - inicio
+    return latencias, recusados, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=32, help="guardas simultâneos")
+    parser.add_argument("--logins", type=int, default=5, help="logins por guarda")
+    parser.add_argument("--rounds", type=int, default=10, help="custo do bcrypt (BCRYPT_ROUNDS)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="threads do pool de hashing")
+    parser.add_argument("--max-pending", type=int, default=None, help="teto de tarefas pendentes")
+    args = parser.parse_args()
+
+    use_database()
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    prepare_schema()
+    usuarios = [f"GUARDA{i:03d}" for i in range(args.concurrency)]
+    create_bench_users(usuarios, rounds=args.rounds)
+
+    import app as app_module
+
+    max_pending = args.max_pending or args.workers * 4
+    cenarios = [
+        ("fila sem limite", args.concurrency, 10 ** 9),
+        (f"pool limitado ({args.workers} threads, fila {max_pending})", args.workers, max_pending),
+    ]
+
+    print(f"bcrypt rounds={args.rounds}  guardas={args.concurrency}  logins/guarda={args.logins}")
+    print("-" * 96)
+    print(f"{'cenário':<44} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'recusados':>10}")
+    for nome, workers, pending in cenarios:
+        latencias, recusados, total = run_round(app_module, usuarios, args.concurrency, args.logins, workers, pending)
+        ms = [l * 1000 for l in latencias]
+        print(f"{nome:<44} {len(ms) / total:>8.1f} {percentile(ms, 50):>9.1f} "
+              f"{percentile(ms, 95):>9.1f} {percentile(ms, 99):>9.1f} {recusados:>10}")
+    print("-" * 96)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Tempo de renderização dos templates com tabelas de 100 e 1000 linhas.
+
+Renderiza dashboard.html e consultar.html em processo (sem HTTP nem banco),
+com a navbar em cache e sem ela, e mede a partida de um worker: compilar
+todos os templates do zero contra carregá-los do cache de bytecode em disco.
+
+Uso:
+    python3 benchmarks/bench_render.py
+    python3 benchmarks/bench_render.py --rows 100,1000 --repeat 50
+"""
+
+import argparse
+import gc
+import shutil
+import tempfile
+import time
+
+from common import percentile, use_database
+
+TEMPLATES = ("dashboard.html", "consultar.html")
+
+
+def fake_rows(n, inicio=1_700_000_000):
+    """Linhas com as colunas de ``controle`` usadas pelas tabelas; metade ainda no pátio"""
+    linhas = []
+    for i in range(n):
+        entrada = inicio + i * 600
+        saiu = i % 2 == 0
+        linhas.append({
+            "id": n - i, "destino": "Recebimento", "tipo": "Carro", "empresa": f"Transportadora {i % 40}",
+            "nome": f"Motorista {i}", "veiculo": "Caminhão", "placa": f"ABC{i % 10000:04d}",
+            "n_nota": str(10000 + i) if i % 3 else "", "data_entrada": "2023-11-14", "hora_entrada": "10:00:00",
+            "data_saida": "2023-11-14" if saiu else None, "hora_saida": "11:30:00" if saiu else None,
+            "entrada_ts": entrada, "saida_ts": entrada + 5400 if saiu else None,
+        })
+    return linhas
+
+
+def contexto(template, linhas):
+    if template == "dashboard.html":
+        return {"registros_hoje": len(linhas), "veiculos_dentro": len(linhas) // 2, "ultimos_registros": linhas}
+    return {"registros": linhas, "filtros": {}, "tem_mais_antigos": True, "tem_mais_novos": False,
+            "arquivado_ate": "", "placa": "", "nome": "", "empresa": "", "data_inicio": "", "data_fim": ""}
+
+
+def medir_render(app, template, linhas, repeat, navbar_em_cache):
+    from flask import render_template, session
+
+    import app as portaria
+
+    tempos = []
+    with app.test_request_context("/"):
+        session["username"] = "BENCH"
+        session["is_admin"] = 1
+        ctx = contexto(template, linhas)
+        render_template(template, **ctx)
+        for _ in range(repeat):
+            if not navbar_em_cache:
+                portaria.fragment_cache.invalidate(("navbar", "BENCH", True))
+            gc.collect()
+            inicio = time.perf_counter()
+            render_template(template, **ctx)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+    return tempos
+
+
+def medir_partida(app, diretorio):
+    """Compila todos os templates em um ambiente novo, como um worker recém-criado"""
+    from jinja2 import FileSystemBytecodeCache
+
+    env = app.create_jinja_environment()
+    env.filters.update(app.jinja_env.filters)
+    env.globals.update(app.jinja_env.globals)
+    env.bytecode_cache = FileSystemBytecodeCache(diretorio) if diretorio else None
+    nomes = env.list_templates(extensions=["html"])
+    inicio = time.perf_counter()
+    for nome in nomes:
+        env.get_template(nome)
+    return len(nomes), (time.perf_counter() - inicio) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="100,1000", help="tamanhos das tabelas, separados por vírgula")
+    parser.add_argument("--repeat", type=int, default=50, help="renderizações medidas por caso")
+    args = parser.parse_args()
+
+    use_database()
+    from app import app
+
+    print(f"{'template':<16} {'linhas':>6} {'navbar':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for n in (int(x) for x in args.rows.split(",")):
+        linhas = fake_rows(n)
+        for template in TEMPLATES:
+            for em_cache in (False, True):
+                tempos = medir_render(app, template, linhas, args.repeat, em_cache)
+                print(f"{template:<16} {n:>6} {'cache' if em_cache else 'render':>8} "
+                      f"{percentile(tempos, 50):>8.2f} {percentile(tempos, 95):>8.2f}")
+
+    diretorio = tempfile.mkdtemp(prefix="portaria_jinja_")
+    try:
+        total, sem_cache = medir_partida(app, None)
+        medir_partida(app, diretorio)
+        _, com_cache = medir_partida(app, diretorio)
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+    print(f"Partida do worker ({total} templates): compilando {sem_cache:.1f} ms, "
+          f"do cache de bytecode {com_cache:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
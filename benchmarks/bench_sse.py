@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Teste de carga do feed ao vivo (/eventos) com muitas telas conectadas.
+
+Abre --clients conexões SSE, registra --events entradas pelo fluxo normal
+(salvar_registro) e mede, em cada tela, o tempo entre o envio da entrada e a
+chegada do evento. Por padrão sobe um gunicorn gthread local com threads
+suficientes para as telas; com --url usa um servidor já rodando.
+
+Uso:
+    python3 benchmarks/bench_sse.py --db /tmp/bench.db --clients 120 --events 50
+    python3 benchmarks/bench_sse.py --url http://127.0.0.1:8000 --db /tmp/bench.db --clients 120
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from datetime import datetime
+
+from common import ROOT, create_bench_users, percentile, prepare_schema, use_database
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_server(host, port, timeout=30):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Servidor não respondeu em {host}:{port}")
+
+
+def login(host, port, username):
+    """Faz login e devolve o cookie de sessão"""
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    corpo = urllib.parse.urlencode({"username": username, "senha": "senha123"})
+    conn.request("POST", "/login", corpo, {"Content-Type": "application/x-www-form-urlencoded"})
+    resposta = conn.getresponse()
+    resposta.read()
+    cookie = resposta.getheader("Set-Cookie", "").split(";")[0]
+    conn.close()
+    if resposta.status != 302 or not cookie:
+        raise RuntimeError(f"Login de {username} falhou ({resposta.status})")
+    return cookie
+
+
+def run_screen(host, port, cookie, enviados, latencias, estado, lock):
+    """Uma tela: fica no /eventos lendo até a conexão ser encerrada"""
+    conn = http.client.HTTPConnection(host, port, timeout=120)
+    try:
+        conn.request("GET", "/eventos", headers={"Cookie": cookie, "Accept": "text/event-stream"})
+        resposta = conn.getresponse()
+        with lock:
+            estado["status"][resposta.status] = estado["status"].get(resposta.status, 0) + 1
+        if resposta.status != 200:
+            resposta.read()
+            return
+        dados = []
+        for bruto in resposta:
+            linha = bruto.decode("utf-8").rstrip("\r\n")
+            if linha.startswith("data:"):
+                dados.append(linha[5:].strip())
+            elif linha.startswith(":"):
+                with lock:
+                    estado["heartbeats"] += 1
+            elif not linha and dados:
+                evento = json.loads("\n".join(dados))
+                dados = []
+                nome = (evento.get("registro") or {}).get("nome", "")
+                if evento.get("tipo") == "entrada" and nome.startswith("SSE-"):
+                    chegada = time.perf_counter()
+                    seq = int(nome[4:])
+                    with lock:
+                        if seq in enviados:
+                            latencias.append(chegada - enviados[seq])
+                        if seq == estado["ultimo"]:
+                            estado["finalizadas"] += 1
+                            if estado["finalizadas"] >= estado["conectadas"]:
+                                estado["pronto"].set()
+                            return
+    except (OSError, http.client.HTTPException):
+        with lock:
+            estado["erros"] += 1
+    finally:
+        conn.close()
+
+
+def run(args):
+    os.environ.setdefault("BCRYPT_ROUNDS", "4")
+    db_path = use_database(args.db)
+    prepare_schema()
+    usuarios = [f"BENCH{i:03d}" for i in range(args.users)]
+    create_bench_users(usuarios, rounds=int(os.environ["BCRYPT_ROUNDS"]))
+
+    servidor = None
+    if args.url:
+        destino = urllib.parse.urlsplit(args.url)
+        host, port = destino.hostname, destino.port or 80
+    else:
+        host, port = "127.0.0.1", free_port()
+        ambiente = dict(os.environ, PORTARIA_DB=db_path, SSE_MAX_CLIENTS=str(args.clients + 8))
+        servidor = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "--worker-class", "gthread",
+             "--threads", str(args.clients + 16), "--workers", str(args.workers),
+             "--bind", f"{host}:{port}", "--graceful-timeout", "2", "--log-level", "warning", "app:app"],
+            cwd=ROOT, env=ambiente,
+        )
+    try:
+        wait_for_server(host, port)
+        cookies = [login(host, port, username) for username in usuarios]
+
+        enviados = {}
+        latencias = []
+        lock = threading.Lock()
+        estado = {"status": {}, "heartbeats": 0, "erros": 0, "finalizadas": 0,
+                  "conectadas": 0, "ultimo": args.events - 1, "pronto": threading.Event()}
+        telas = [
+            threading.Thread(target=run_screen, daemon=True,
+                             args=(host, port, cookies[i % len(cookies)], enviados, latencias, estado, lock))
+            for i in range(args.clients)
+        ]
+        inicio_conexao = time.perf_counter()
+        for t in telas:
+            t.start()
+        # Espera as telas conectarem (as recusadas com 503 não contam)
+        limite = time.monotonic() + 30
+        while time.monotonic() < limite:
+            with lock:
+                respondidas = sum(estado["status"].values())
+            if respondidas >= args.clients:
+                break
+            time.sleep(0.1)
+        estado["conectadas"] = estado["status"].get(200, 0)
+        tempo_conexao = time.perf_counter() - inicio_conexao
+
+        guarda = http.client.HTTPConnection(host, port, timeout=30)
+        for seq in range(args.events):
+            agora = datetime.now()
+            corpo = urllib.parse.urlencode({
+                "destino": "Recebimento", "tipo": "Carro", "empresa": "Benchmark SSE",
+                "nome": f"SSE-{seq}", "placa": f"SSE{seq % 10000:04d}",
+                "data_entrada": agora.strftime("%Y-%m-%d"), "hora_entrada": agora.strftime("%H:%M"),
+            })
+            with lock:
+                enviados[seq] = time.perf_counter()
+            guarda.request("POST", "/salvar_registro", corpo,
+                           {"Content-Type": "application/x-www-form-urlencoded", "Cookie": cookies[0]})
+            guarda.getresponse().read()
+            time.sleep(args.interval)
+        guarda.close()
+
+        estado["pronto"].wait(timeout=args.interval * args.events + 30)
+    finally:
+        if servidor:
+            servidor.terminate()
+            servidor.wait(timeout=10)
+
+    ms = [v * 1000 for v in latencias]
+    esperados = estado["conectadas"] * args.events
+    return {
+        "clients": args.clients,
+        "connected": estado["conectadas"],
+        "rejected_503": estado["status"].get(503, 0),
+        "connect_seconds": round(tempo_conexao, 2),
+        "events": args.events,
+        "delivered": len(ms),
+        "expected": esperados,
+        "errors": estado["erros"],
+        "p50": round(percentile(ms, 50), 1),
+        "p95": round(percentile(ms, 95), 1),
+        "p99": round(percentile(ms, 99), 1),
+        "max": round(max(ms), 1) if ms else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", required=True, help="banco da aplicação (criado se não existir)")
+    parser.add_argument("--url", help="servidor a testar (padrão: sobe um gunicorn gthread local)")
+    parser.add_argument("--clients", type=int, default=120, help="telas conectadas ao /eventos")
+    parser.add_argument("--events", type=int, default=50, help="entradas registradas durante o teste")
+    parser.add_argument("--interval", type=float, default=0.1, help="segundos entre as entradas")
+    parser.add_argument("--users", type=int, default=10, help="usuários distintos entre as telas")
+    parser.add_argument("--workers", type=int, default=1, help="workers do gunicorn local")
+    args = parser.parse_args()
+
+    r = run(args)
+    print(f"Telas: {r['connected']}/{r['clients']} conectadas em {r['connect_seconds']}s "
+          f"({r['rejected_503']} recusadas com 503, {r['errors']} erros)")
+    print(f"Eventos: {r['delivered']}/{r['expected']} entregues")
+    print(f"Latência entrada -> tela: p50 {r['p50']} ms, p95 {r['p95']} ms, p99 {r['p99']} ms, máx {r['max']} ms")
+    if r["delivered"] < r["expected"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
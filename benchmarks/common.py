@@ -0,0 +1,59 @@
+"""
+Funções compartilhadas pelos scripts de benchmark.
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+PERMISSION_COLUMNS = (
+    "libid, libdestino, libtipo, libempresa, libnome, librg, libveiculo, libplaca, libcr, libn_nota, libobs, "
+    "libdata_entrada, libdata_saida, libperiodo, libperiodoalterado, libusuario, libusuarioalterado, "
+    "libhora_entrada, libhora_saida"
+)
+
+
+def percentile(valores, p):
+    """Percentil por vizinho mais próximo (suficiente para relatórios de benchmark)"""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    k = min(len(ordenados) - 1, max(0, round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[k]
+
+
+def use_database(path=None):
+    """Aponta PORTARIA_DB para ``path`` (ou um arquivo temporário) antes de importar o app"""
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(prefix="portaria_bench_"), "portaria.db")
+    os.environ["PORTARIA_DB"] = os.path.abspath(path)
+    return os.environ["PORTARIA_DB"]
+
+
+def prepare_schema():
+    import setup_database_bcrypt as setup
+    setup.create_tables()
+    setup.run_migrations(verbose=False)
+    return setup
+
+
+def create_bench_users(usernames, password="senha123", rounds=4):
+    """Cria (ou substitui) usuários com todas as permissões de portaria"""
+    import bcrypt
+    import setup_database_bcrypt as setup
+
+    senha = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=rounds)).decode("utf-8")
+    conn = setup.get_db_connection()
+    for username in usernames:
+        conn.execute("DELETE FROM usuarios WHERE username = ?", (username,))
+        conn.execute(
+            "INSERT INTO usuarios (username, senha, ip, is_admin, libinserir, libalterar, libexcluir, libconsulta, "
+            f"{PERMISSION_COLUMNS}) VALUES (?, ?, 'livre', 0, 'sim', 'sim', 'sim', 'sim'" + ", ''" * 19 + ")",
+            (username, senha),
+        )
+    conn.commit()
+    conn.close()
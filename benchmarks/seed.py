@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Popula um banco com movimentações sintéticas de portaria.
+
+Gera entradas distribuídas pelos últimos N anos, com pico de chegadas pela
+manhã, placas no formato antigo e Mercosul, nomes com acento e uma fração de
+veículos ainda dentro do pátio nos últimos dias. A geração é determinística
+para a mesma semente.
+
+Uso:
+    python3 benchmarks/seed.py --db /tmp/bench.db --rows 1000000 --years 5
+"""
+
+import argparse
+import random
+import string
+import time
+from datetime import datetime, timedelta
+
+from common import prepare_schema, use_database
+
+DESTINOS = ["Almoxarifado", "Expedição", "Recebimento", "Manutenção", "Administração",
+            "Produção", "Refeitório", "Portaria 2", "Laboratório", "Pátio Externo"]
+TIPOS = ["Carro", "Caminhão", "Moto", "Van", "Ônibus", "Outros"]
+TIPOS_PESOS = [35, 40, 10, 8, 2, 5]
+PRIMEIROS_NOMES = ["João", "José", "Antônio", "Francisco", "Carlos", "Paulo", "Pedro", "Lucas", "Luiz",
+                   "Marcos", "Luís", "Gabriel", "Rafael", "Daniel", "Márcio", "Maria", "Ana", "Francisca",
+                   "Antônia", "Adriana", "Juliana", "Márcia", "Fernanda", "Patrícia", "Aline", "Sérgio",
+                   "Cláudio", "Fábio", "Vitória", "Conceição"]
+SOBRENOMES = ["Silva", "Santos", "Oliveira", "Souza", "Rodrigues", "Ferreira", "Alves", "Pereira", "Lima",
+              "Gomes", "Ribeiro", "Carvalho", "Araújo", "Melo", "Barbosa", "Cardoso", "Conceição", "Simões",
+              "Gonçalves", "Brandão", "Magalhães", "Assunção"]
+SUFIXOS_EMPRESA = ["Transportes", "Logística", "Comércio", "Serviços", "Engenharia", "Distribuidora",
+                   "Alimentos", "Construções", "Mineração", "Química"]
+VEICULOS = ["Volkswagen Gol", "Fiat Strada", "Mercedes Atego", "Volvo FH", "Scania R450", "Ford Cargo",
+            "Honda CG 160", "Renault Master", "Iveco Daily", "Toyota Hilux", "Chevrolet S10"]
+
+INSERT = """
+    INSERT INTO controle (
+        destino, tipo, empresa, nome, rg, veiculo, placa, cr,
+        data_entrada, data_saida, hora_entrada, hora_saida,
+        n_nota, obs, periodo, periodoalterado, usuario, usuarioalterado, data_alterada
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def gerar_placa(rng):
+    letras = "".join(rng.choice(string.ascii_uppercase) for _ in range(3))
+    if rng.random() < 0.5:
+        return f"{letras}-{rng.randint(0, 9999):04d}"
+    return f"{letras}{rng.randint(0, 9)}{rng.choice(string.ascii_uppercase)}{rng.randint(0, 99):02d}"
+
+
+def gerar_frota(rng, visitantes, empresas):
+    """Visitantes recorrentes: a mesma placa volta muitas vezes com o mesmo motorista"""
+    frota = []
+    for _ in range(visitantes):
+        tipo = rng.choices(TIPOS, TIPOS_PESOS)[0]
+        frota.append({
+            "placa": gerar_placa(rng),
+            "nome": f"{rng.choice(PRIMEIROS_NOMES)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}",
+            "empresa": rng.choice(empresas),
+            "tipo": tipo,
+            "veiculo": rng.choice(VEICULOS),
+            "rg": f"{rng.randint(10, 99)}.{rng.randint(100, 999)}.{rng.randint(100, 999)}-{rng.randint(0, 9)}",
+            "cr": str(rng.randint(1000, 9999)) if rng.random() < 0.3 else "",
+        })
+    return frota
+
+
+def gerar_linhas(rng, total, anos, frota, agora):
+    inicio = agora - timedelta(days=365 * anos)
+    segundos = int((agora - inicio).total_seconds())
+    offsets = sorted(rng.randrange(segundos) for _ in range(total))
+    for offset in offsets:
+        entrada = inicio + timedelta(seconds=offset)
+        # Pico de chegadas entre 6h e 10h
+        if rng.random() < 0.45:
+            entrada = entrada.replace(hour=rng.randint(6, 9))
+        visitante = rng.choice(frota)
+        permanencia = timedelta(minutes=int(rng.lognormvariate(4.2, 0.8)))
+        saida = entrada + permanencia
+        dentro = saida > agora or (agora - entrada < timedelta(days=1) and rng.random() < 0.3)
+        yield (
+            rng.choice(DESTINOS), visitante["tipo"], visitante["empresa"], visitante["nome"],
+            visitante["rg"], visitante["veiculo"], visitante["placa"], visitante["cr"],
+            entrada.strftime("%Y-%m-%d"), "" if dentro else saida.strftime("%Y-%m-%d"),
+            entrada.strftime("%H:%M"), "" if dentro else saida.strftime("%H:%M:%S"),
+            str(rng.randint(100000, 999999)) if rng.random() < 0.4 else "",
+            "Carga frágil" if rng.random() < 0.02 else "",
+            entrada.strftime("%Y-%m-%d %H:%M:%S"), "", "PORTARIA", "", "",
+        )
+
+
+def seed(rows, years=5, visitors=None, seed_value=42, batch=20000, verbose=True):
+    setup = prepare_schema()
+    rng = random.Random(seed_value)
+    empresas = [f"{rng.choice(SOBRENOMES)} {rng.choice(SUFIXOS_EMPRESA)}" for _ in range(400)]
+    frota = gerar_frota(rng, visitors or max(50, rows // 40), empresas)
+
+    conn = setup.get_db_connection()
+    conn.execute("PRAGMA journal_mode = WAL")
+    inicio = time.perf_counter()
+    lote = []
+    inseridos = 0
+    for linha in gerar_linhas(rng, rows, years, frota, datetime.now()):
+        lote.append(linha)
+        if len(lote) >= batch:
+            conn.executemany(INSERT, lote)
+            conn.commit()
+            inseridos += len(lote)
+            lote.clear()
+            if verbose:
+                print(f"   {inseridos}/{rows} linhas ({inseridos / (time.perf_counter() - inicio):.0f}/s)")
+    if lote:
+        conn.executemany(INSERT, lote)
+        conn.commit()
+        inseridos += len(lote)
+    conn.execute("ANALYZE")
+    conn.close()
+    if verbose:
+        print(f"✓ {inseridos} movimentações geradas em {time.perf_counter() - inicio:.1f}s.")
+    return inseridos
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", required=True, help="arquivo SQLite a popular (criado se não existir)")
+    parser.add_argument("--rows", type=int, default=100000, help="movimentações a gerar")
+    parser.add_argument("--years", type=int, default=5, help="anos de histórico")
+    parser.add_argument("--visitors", type=int, default=None, help="placas distintas (padrão: rows / 40)")
+    parser.add_argument("--seed", type=int, default=42, help="semente do gerador")
+    args = parser.parse_args()
+
+    use_database(args.db)
+    seed(args.rows, args.years, args.visitors, args.seed)
@@ -0,0 +1,79 @@
+"""
+Datas e horas de 'controle' como instantes inteiros.
+
+As colunas de texto (data_entrada "AAAA-MM-DD", hora_entrada "HH:MM[:SS]")
+continuam sendo a fonte; ``timestamp_sql`` gera a expressão das colunas
+entrada_ts/saida_ts (segundos desde 1970 no horário local da portaria, sem
+fuso). ``para_epoch`` e ``timestamp_sql`` precisam produzir o mesmo valor.
+"""
+
+import calendar
+import re
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+EPOCH = datetime(1970, 1, 1)
+
+# Formatos antigos encontrados em bancos migrados, além do ISO
+FORMATOS_DATA = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d", "%d/%m/%y", "%d.%m.%Y")
+
+_HORA = re.compile(r"(\d{1,2})[:hH](\d{2})(?::(\d{2}))?")
+
+
+def normalizar_data(texto):
+    """"31/01/2024", "2024-01-31 08:00:00" -> "2024-01-31"; None se não reconhecer"""
+    texto = (texto or "").strip()
+    for formato in FORMATOS_DATA:
+        try:
+            return datetime.strptime(texto[:10] if formato == "%Y-%m-%d" else texto, formato).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return None
+
+
+def normalizar_hora(texto):
+    """"8:05", "08h05" -> "08:05"; mantém os segundos; None se não reconhecer"""
+    m = _HORA.fullmatch((texto or "").strip())
+    if not m or int(m.group(1)) > 23 or int(m.group(2)) > 59 or int(m.group(3) or 0) > 59:
+        return None
+    hora = f"{int(m.group(1)):02d}:{m.group(2)}"
+    return f"{hora}:{m.group(3)}" if m.group(3) else hora
+
+
+def timestamp_sql(data, hora):
+    """Expressão SQL do instante de ``data`` + ``hora``; NULL sem data válida"""
+    return (f"CAST(strftime('%s', CASE WHEN {hora} = '' THEN {data} "
+            f"ELSE {data} || ' ' || {hora} END) AS INTEGER)")
+
+
+def para_epoch(data, hora=""):
+    """Equivalente Python de ``timestamp_sql``; ``data`` pode ser str ou date"""
+    if isinstance(data, date):
+        return calendar.timegm(data.timetuple())
+    try:
+        valor = datetime.fromisoformat(f"{data} {hora}".strip())
+    except ValueError:
+        return None
+    return calendar.timegm(valor.timetuple())
+
+
+def de_epoch(ts):
+    return EPOCH + timedelta(seconds=ts)
+
+
+@lru_cache(maxsize=8192)
+def datahora_br(valor):
+    """Instante (int) ou texto ISO -> "dd/mm/aaaa hh:mm", sempre sem os segundos.
+
+    Texto só com a data ("AAAA-MM-DD") sai só com a data. O mesmo formato de
+    formatDataHoraBR (static/js/main.js), usado nas linhas do feed ao vivo.
+    """
+    if valor is None or valor == "":
+        return ""
+    ts = valor if isinstance(valor, int) else para_epoch(valor)
+    if ts is None:
+        return str(valor)
+    instante = de_epoch(ts)
+    if isinstance(valor, str) and len(valor.strip()) == 10:
+        return instante.strftime("%d/%m/%Y")
+    return instante.strftime("%d/%m/%Y %H:%M")
@@ -0,0 +1,296 @@
+"""
+Camada de conexões SQLite da aplicação.
+
+Mantém um pool limitado de conexões por processo (cada worker do gunicorn
+tem o seu) e aplica os PRAGMAs de desempenho uma única vez, quando a conexão
+é aberta.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import metrics
+
+DATABASE = os.environ.get("PORTARIA_DB", "portaria.db")
+
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+
+# Conexões só de leitura (replica.py) usam apenas os PRAGMAs de cache
+READ_PRAGMAS = (
+    "PRAGMA mmap_size = %d" % int(os.environ.get("DB_MMAP_SIZE", str(64 * 1024 * 1024))),
+    "PRAGMA cache_size = %d" % int(os.environ.get("DB_CACHE_SIZE", "-16000")),
+    "PRAGMA busy_timeout = %d" % int(os.environ.get("DB_BUSY_TIMEOUT", "5000")),
+)
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+) + READ_PRAGMAS
+
+
+class PoolTimeout(Exception):
+    """Nenhuma conexão ficou livre dentro do tempo limite"""
+
+
+def connect(database=None):
+    """Abre uma conexão nova já configurada com os PRAGMAs"""
+    conn = sqlite3.connect(database or DATABASE, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def data_version(database=None):
+    """Versão dos dados obtida sem consultar o SQLite; muda a cada commit.
+
+    Em WAL todo commit escreve no arquivo -wal e o checkpoint escreve no
+    arquivo principal, então tamanho e mtime dos dois identificam o estado.
+    """
+    caminho = database or DATABASE
+    partes = []
+    for sufixo in ("", "-wal"):
+        try:
+            st = os.stat(caminho + sufixo)
+            partes.append("%x.%x" % (st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            partes.append("-")
+    return "-".join(partes)
+
+
+class TimedCursor:
+    """Cursor que mede o tempo da instrução (execução + leitura) e conta as linhas.
+
+    A medida é registrada quando o resultado se esgota, quando o cursor é
+    fechado ou quando ele deixa de ser referenciado.
+    """
+
+    def __init__(self, cursor, sql, elapsed):
+        self._cursor = cursor
+        self._sql = sql
+        self._elapsed = elapsed
+        self._rows = 0
+        self._recorded = False
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def _timed_fetch(self, method, *args):
+        inicio = time.perf_counter()
+        result = method(*args)
+        self._elapsed += time.perf_counter() - inicio
+        return result
+
+    def fetchone(self):
+        row = self._timed_fetch(self._cursor.fetchone)
+        if row is None:
+            self._record()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._timed_fetch(self._cursor.fetchmany, *args)
+        self._rows += len(rows)
+        if not rows:
+            self._record()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed_fetch(self._cursor.fetchall)
+        self._rows += len(rows)
+        self._record()
+        return rows
+
+    def close(self):
+        self._record()
+        self._cursor.close()
+
+    def _record(self):
+        if not self._recorded:
+            self._recorded = True
+            rows = self._rows or max(self._cursor.rowcount, 0)
+            metrics.record_statement(self._sql, self._elapsed, rows)
+
+    def __del__(self):
+        try:
+            self._record()
+        except Exception:
+            pass
+
+
+class PooledConnection:
+    """Conexão emprestada do pool.
+
+    Repassa tudo para a conexão real; ``close()`` devolve a conexão ao pool
+    em vez de fechá-la. Quando ``scoped`` é verdadeiro a conexão pertence à
+    requisição: ``close()`` não faz nada e a devolução acontece no teardown,
+    via ``release()``, de modo que o código que chama ``conn.close()`` no
+    meio da rota continua funcionando.
+    """
+
+    def __init__(self, pool, conn, scoped=False):
+        self._pool = pool
+        self._conn = conn
+        self._scoped = scoped
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def execute(self, sql, parameters=()):
+        inicio = time.perf_counter()
+        cursor = self._conn.execute(sql, parameters)
+        return TimedCursor(cursor, sql, time.perf_counter() - inicio)
+
+    def executemany(self, sql, seq_of_parameters):
+        inicio = time.perf_counter()
+        cursor = self._conn.executemany(sql, seq_of_parameters)
+        return TimedCursor(cursor, sql, time.perf_counter() - inicio)
+
+    @property
+    def raw(self):
+        return self._conn
+
+    def close(self):
+        if not self._scoped:
+            self.release()
+
+    def release(self):
+        if self._conn is not None:
+            self._pool.release(self._conn)
+            self._conn = None
+
+
+class ConnectionPool:
+    """Pool limitado de conexões SQLite, seguro para threads"""
+
+    def __init__(self, database=None, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.database = database or DATABASE
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+
+    def _connect(self):
+        return connect(self.database)
+
+    def _reset_after_fork(self):
+        # Conexões SQLite não podem atravessar um fork: o worker recomeça do zero
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._pid = os.getpid()
+
+    def acquire(self, scoped=False):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset_after_fork()
+            try:
+                conn = self._idle.get_nowait()
+                self.hits += 1
+                return PooledConnection(self, conn, scoped)
+            except queue.Empty:
+                pass
+            if self._created < self.size:
+                self._created += 1
+                self.misses += 1
+                create = True
+            else:
+                create = False
+
+        if create:
+            try:
+                return PooledConnection(self, self._connect(), scoped)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        inicio = time.perf_counter()
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            with self._lock:
+                self.timeouts += 1
+            raise PoolTimeout("Tempo esgotado aguardando conexão com o banco de dados")
+        espera = time.perf_counter() - inicio
+        with self._lock:
+            self.waits += 1
+            self.wait_time += espera
+        return PooledConnection(self, conn, scoped)
+
+    def release(self, conn):
+        if self._pid != os.getpid():
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Conexão quebrada: descarta e libera a vaga
+            with self._lock:
+                self._created -= 1
+            return
+        self._idle.put(conn)
+
+    def discard(self, conn):
+        """Fecha ``conn`` em vez de devolvê-la e libera a vaga"""
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def discard_idle(self):
+        """Fecha as conexões ociosas; as emprestadas seguem até a devolução"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self.discard(conn)
+
+    def connection(self):
+        """Uso com ``with pool.connection() as conn:``"""
+        return self.acquire()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "open": self._created,
+                "idle": self._idle.qsize(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "wait_time_total": round(self.wait_time, 6),
+            }
+
+
+pool = ConnectionPool()
@@ -0,0 +1,300 @@
+"""
+Feed ao vivo das movimentações da portaria (Server-Sent Events).
+
+Os eventos são gravados na tabela 'eventos' por triggers em 'controle'. Cada
+worker tem uma única thread (o broker) que acompanha a tabela e distribui os
+eventos novos para as filas das telas conectadas àquele worker: o custo no
+banco é por worker, não por tela. Enquanto a versão dos dados (stat do banco
+e do -wal) não muda, o broker nem consulta o SQLite.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import db
+
+logger = logging.getLogger(__name__)
+
+EVENT_POLL_INTERVAL = float(os.environ.get("EVENT_POLL_INTERVAL", "0.25"))
+SSE_HEARTBEAT = float(os.environ.get("SSE_HEARTBEAT", "15"))
+SSE_MAX_CLIENTS = int(os.environ.get("SSE_MAX_CLIENTS", "48"))
+EVENT_RETENTION = int(os.environ.get("EVENT_RETENTION", "10000"))
+
+# Eventos recentes guardados em memória para quem reconecta com Last-Event-ID
+EVENT_BUFFER = 256
+SUBSCRIBER_QUEUE = 256
+PRUNE_INTERVAL = 3600
+
+PRUNE_SQL = "DELETE FROM eventos WHERE id <= (SELECT max(id) FROM eventos) - ?"
+
+# Avisa a tela que ela perdeu eventos e deve recarregar os dados pela API
+RESYNC = {"tipo": "resync"}
+
+
+class TooManySubscribers(Exception):
+    """Limite de telas conectadas a este worker atingido"""
+
+
+class Subscription:
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE)
+
+    def put(self, evento):
+        try:
+            self.queue.put_nowait(evento)
+        except queue.Full:
+            # Tela lenta: descarta o atrasado e pede para recarregar
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.queue.put_nowait(RESYNC)
+            return False
+        return True
+
+
+class AsyncSubscription:
+    """Tela atendida por uma corrotina (asgi.py) em vez de uma thread.
+
+    O broker entrega pela thread dele; ``put`` guarda o evento e acorda o
+    loop de eventos, e a corrotina recolhe tudo o que chegou com ``get``.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.pendentes = deque()
+        self.lock = threading.Lock()
+        self.sinal = asyncio.Event()
+        self.fechada = False
+
+    def put(self, evento):
+        with self.lock:
+            cheia = len(self.pendentes) >= SUBSCRIBER_QUEUE
+            if cheia:
+                self.pendentes.clear()
+                self.pendentes.append(RESYNC)
+            else:
+                self.pendentes.append(evento)
+        try:
+            self.loop.call_soon_threadsafe(self.sinal.set)
+        except RuntimeError:
+            # Loop já encerrado (worker saindo)
+            pass
+        return not cheia
+
+    async def get(self, timeout):
+        """Eventos pendentes; [] se nada chegar em ``timeout`` segundos"""
+        try:
+            await asyncio.wait_for(self.sinal.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self.sinal.clear()
+        with self.lock:
+            eventos = list(self.pendentes)
+            self.pendentes.clear()
+        return eventos
+
+    def fechar(self):
+        self.fechada = True
+        self.sinal.set()
+
+
+class EventBroker:
+    def __init__(self, database=None, interval=EVENT_POLL_INTERVAL, max_clients=SSE_MAX_CLIENTS):
+        self.database = database
+        self.interval = interval
+        self.max_clients = max_clients
+        self._subscribers = set()
+        self._buffer = deque(maxlen=EVENT_BUFFER)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.published = 0
+        self.delivered = 0
+        self.resyncs = 0
+        self.rejected = 0
+        self.fetches = 0
+        self.prunes = 0
+        self._proxima_limpeza = time.monotonic() + PRUNE_INTERVAL
+
+    def _ensure_thread(self):
+        # Threads não sobrevivem ao fork do gunicorn: cada worker inicia o seu broker
+        if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+            if self._pid != os.getpid():
+                self._subscribers = set()
+                self._buffer.clear()
+            self._thread = threading.Thread(target=self._loop, name="eventos", daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def subscribe(self, last_event_id=None, sub=None):
+        """Nova tela conectada; com ``last_event_id`` reenvia o que ela perdeu.
+
+        ``sub`` permite outra forma de entrega (``AsyncSubscription``).
+        """
+        with self._lock:
+            self._ensure_thread()
+            if len(self._subscribers) >= self.max_clients:
+                self.rejected += 1
+                raise TooManySubscribers("Limite de telas ao vivo atingido neste worker")
+            if sub is None:
+                sub = Subscription()
+            if last_event_id is not None:
+                if self._buffer and self._buffer[0]["id"] <= last_event_id + 1:
+                    for evento in self._buffer:
+                        if evento["id"] > last_event_id:
+                            sub.put(evento)
+                else:
+                    sub.put(RESYNC)
+            self._subscribers.add(sub)
+            return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def publish(self, eventos):
+        with self._lock:
+            self._buffer.extend(eventos)
+            assinantes = list(self._subscribers)
+        for sub in assinantes:
+            for evento in eventos:
+                if sub.put(evento):
+                    self.delivered += 1
+                else:
+                    self.resyncs += 1
+                    break
+        self.published += len(eventos)
+
+    def stream(self, sub, heartbeat=SSE_HEARTBEAT):
+        """Gerador do corpo text/event-stream de uma tela"""
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    evento = sub.queue.get(timeout=heartbeat)
+                except queue.Empty:
+                    # Comentário SSE: mantém proxies abertos e detecta telas desconectadas
+                    yield ": ping\n\n"
+                    continue
+                yield format_event(evento)
+        finally:
+            self.unsubscribe(sub)
+
+    def _fetch(self, conn, ultimo_id):
+        conn.execute("BEGIN")
+        try:
+            rows = conn.execute(
+                "SELECT id, tipo, registro_id FROM eventos WHERE id > ? ORDER BY id LIMIT 1000",
+                (ultimo_id,)
+            ).fetchall()
+            if not rows:
+                return []
+            ids = sorted({row["registro_id"] for row in rows})
+            marcadores = ",".join("?" * len(ids))
+            registros = {
+                row["id"]: dict(row)
+                for row in conn.execute(f"SELECT * FROM controle WHERE id IN ({marcadores})", ids)
+            }
+            hoje = datetime.now().strftime("%Y-%m-%d")
+            row = conn.execute("SELECT entradas FROM contagem_diaria WHERE data = ?", (hoje,)).fetchone()
+            contadores = {
+                "data": hoje,
+                "registros_hoje": row["entradas"] if row else 0,
+                "veiculos_dentro": conn.execute(
+                    "SELECT valor FROM contadores WHERE chave = 'veiculos_dentro'"
+                ).fetchone()["valor"],
+            }
+        finally:
+            conn.execute("COMMIT")
+        self.fetches += 1
+        return [
+            dict(contadores, id=row["id"], tipo=row["tipo"], registro_id=row["registro_id"],
+                 registro=registros.get(row["registro_id"]))
+            for row in rows
+        ]
+
+    def prune_if_due(self):
+        """Limpa a tabela a cada PRUNE_INTERVAL, haja ou não telas conectadas.
+
+        Chamado pelo broker e depois de cada POST (app.py): sem telas o broker
+        nem roda, e a tabela cresceria sem limite.
+        """
+        agora = time.monotonic()
+        with self._lock:
+            if agora < self._proxima_limpeza:
+                return
+            self._proxima_limpeza = agora + PRUNE_INTERVAL
+            self.prunes += 1
+        self._prune()
+
+    def _prune(self):
+        from writer import writer
+        writer.submit(lambda conn: prune(conn))
+
+    def _loop(self):
+        conn = db.connect(self.database)
+        ultimo = "SELECT coalesce(max(id), 0) FROM eventos"
+        versao = db.data_version(self.database)
+        ultimo_id = conn.execute(ultimo).fetchone()[0]
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.prune_if_due()
+                atual = db.data_version(self.database)
+                if atual == versao:
+                    continue
+                versao = atual
+                if not self._subscribers:
+                    # Sem telas: só acompanha o fim do log, sem buscar os eventos
+                    ultimo_id = conn.execute(ultimo).fetchone()[0]
+                    with self._lock:
+                        self._buffer.clear()
+                    continue
+                while True:
+                    eventos = self._fetch(conn, ultimo_id)
+                    if not eventos:
+                        break
+                    ultimo_id = eventos[-1]["id"]
+                    self.publish(eventos)
+            except Exception:
+                logger.exception("Falha ao ler eventos")
+                versao = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "max_clients": self.max_clients,
+                "published": self.published,
+                "delivered": self.delivered,
+                "resyncs": self.resyncs,
+                "rejected": self.rejected,
+                "fetches": self.fetches,
+                "prunes": self.prunes,
+            }
+
+
+def prune(conn, retention=EVENT_RETENTION):
+    """Mantém só os ``retention`` eventos mais recentes"""
+    return conn.execute(PRUNE_SQL, (retention,)).rowcount
+
+
+def format_event(evento):
+    linhas = []
+    if "id" in evento:
+        linhas.append(f"id: {evento['id']}")
+    linhas.append(f"event: {evento['tipo']}")
+    linhas.append("data: " + json.dumps(evento, ensure_ascii=False, separators=(",", ":")))
+    return "\n".join(linhas) + "\n\n"
+
+
+broker = EventBroker()
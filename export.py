@@ -0,0 +1,174 @@
+"""
+Exportação em streaming dos registros de controle (CSV e XLSX).
+
+Os geradores consomem o cursor em lotes de ``fetchmany`` e devolvem bytes
+assim que cada lote é escrito, de modo que a memória fica constante qualquer
+que seja a quantidade de linhas e o primeiro byte sai antes do fim da
+consulta.
+"""
+
+import csv
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+BATCH_SIZE = 1000
+
+EXPORT_COLUMNS = (
+    ("id", "ID"),
+    ("destino", "Destino"),
+    ("tipo", "Tipo"),
+    ("empresa", "Empresa"),
+    ("nome", "Nome"),
+    ("rg", "RG/CPF"),
+    ("veiculo", "Veículo"),
+    ("placa", "Placa"),
+    ("cr", "CR"),
+    ("n_nota", "Nº Nota"),
+    ("data_entrada", "Data Entrada"),
+    ("hora_entrada", "Hora Entrada"),
+    ("data_saida", "Data Saída"),
+    ("hora_saida", "Hora Saída"),
+    ("obs", "Observações"),
+    ("usuario", "Usuário"),
+)
+
+EXPORT_SELECT = ", ".join(coluna for coluna, _ in EXPORT_COLUMNS)
+
+
+def iter_csv(cursor, batch_size=BATCH_SIZE):
+    """CSV com separador ';' e BOM UTF-8, como o Excel em português espera"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=";")
+    buffer.write("\ufeff")
+    writer.writerow([titulo for _, titulo in EXPORT_COLUMNS])
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        writer.writerows(tuple(row) for row in rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+# ==================== XLSX ====================
+# Planilha mínima (uma aba, strings inline) escrita direto no zip, sem montar
+# o arquivo em memória.
+
+_CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+</Types>"""
+
+_ROOT_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>"""
+
+_WORKBOOK = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="Registros" sheetId="1" r:id="rId1"/></sheets>
+</workbook>"""
+
+_WORKBOOK_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>"""
+
+_STYLES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font><font><b/><sz val="11"/><name val="Calibri"/></font></fonts>
+<fills count="1"><fill><patternFill patternType="none"/></fill></fills>
+<borders count="1"><border/></borders>
+<cellStyleXfs count="1"><xf/></cellStyleXfs>
+<cellXfs count="2"><xf/><xf fontId="1" applyFont="1"/></cellXfs>
+<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>
+</styleSheet>"""
+
+_SHEET_HEAD = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+               '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+               '<sheetViews><sheetView workbookViewId="0"><pane ySplit="1" topLeftCell="A2" state="frozen"/>'
+               '</sheetView></sheetViews><sheetData>')
+_SHEET_TAIL = "</sheetData></worksheet>"
+
+# Caracteres de controle não são permitidos em XML 1.0
+_INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Destino do zip que só acumula bytes até o próximo ``drain()``.
+
+    Não é "seekable", então o zipfile grava descritores de dados após cada
+    arquivo e nunca volta atrás no fluxo.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._data.extend(data)
+        return len(data)
+
+    def drain(self):
+        data = bytes(self._data)
+        self._data.clear()
+        return data
+
+
+def _cell(value, style=0):
+    estilo = f' s="{style}"' if style else ""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f"<c{estilo}><v>{value}</v></c>"
+    if value is None or value == "":
+        return "<c/>"
+    texto = escape(_INVALID_XML.sub("", str(value)))
+    return f'<c t="inlineStr"{estilo}><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _row(values, style=0):
+    return "<row>" + "".join(_cell(value, style) for value in values) + "</row>"
+
+
+def iter_xlsx(cursor, batch_size=BATCH_SIZE):
+    """Planilha XLSX gerada em streaming a partir do cursor"""
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        zf.writestr("_rels/.rels", _ROOT_RELS)
+        zf.writestr("xl/workbook.xml", _WORKBOOK)
+        zf.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        zf.writestr("xl/styles.xml", _STYLES)
+        yield buffer.drain()
+
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(_SHEET_HEAD.encode("utf-8"))
+            sheet.write(_row([titulo for _, titulo in EXPORT_COLUMNS], style=1).encode("utf-8"))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                sheet.write("".join(_row(row) for row in rows).encode("utf-8"))
+                chunk = buffer.drain()
+                if chunk:
+                    yield chunk
+            sheet.write(_SHEET_TAIL.encode("utf-8"))
+    yield buffer.drain()
+
+
+EXPORT_FORMATS = {
+    "csv": (iter_csv, "text/csv; charset=utf-8", "csv"),
+    "xlsx": (iter_xlsx, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+}
@@ -0,0 +1,141 @@
+"""
+Métricas em memória (por processo) no formato texto do Prometheus.
+
+Cada worker do gunicorn mantém seus próprios valores, então cada coleta
+mostra apenas o worker que atendeu a requisição de /metrics.
+"""
+
+import logging
+import os
+import re
+import threading
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Consultas acima deste tempo (ms) vão para o log "portaria.sql"; 0 desliga
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "0"))
+
+slow_query_logger = logging.getLogger("portaria.sql")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pares = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        linhas = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for valores, total in sorted(self._values.items()):
+                linhas.append(f"{self.name}{_format_labels(self.labels, valores)} {total}")
+        return linhas
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            serie = self._values.get(label_values)
+            if serie is None:
+                serie = self._values[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if value <= limite:
+                    serie[i] += 1
+            serie[-2] += value
+            serie[-1] += 1
+
+    def render(self):
+        linhas = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for valores, serie in sorted(self._values.items()):
+                for limite, total in zip(self.buckets, serie):
+                    rotulos = _format_labels(self.labels, valores, [f'le="{limite}"'])
+                    linhas.append(f"{self.name}_bucket{rotulos} {total}")
+                rotulos = _format_labels(self.labels, valores, ['le="+Inf"'])
+                linhas.append(f"{self.name}_bucket{rotulos} {serie[-1]}")
+                linhas.append(f"{self.name}_sum{_format_labels(self.labels, valores)} {serie[-2]:.6f}")
+                linhas.append(f"{self.name}_count{_format_labels(self.labels, valores)} {serie[-1]}")
+        return linhas
+
+
+REQUEST_DURATION = Histogram(
+    "portaria_http_request_duration_seconds", "Latência das requisições por endpoint", ("endpoint", "method"))
+REQUESTS_TOTAL = Counter(
+    "portaria_http_requests_total", "Requisições por endpoint e status", ("endpoint", "method", "status"))
+SQL_DURATION = Histogram(
+    "portaria_sql_duration_seconds", "Tempo de execução e leitura por instrução SQL", ("statement",))
+SQL_ROWS = Counter(
+    "portaria_sql_rows_total", "Linhas lidas ou alteradas por instrução SQL", ("statement",))
+SLOW_QUERIES = Counter(
+    "portaria_sql_slow_queries_total", "Instruções acima de SLOW_QUERY_MS", ("statement",))
+TEMPLATE_RENDER = Histogram(
+    "portaria_template_render_seconds", "Tempo de renderização por template", ("template",))
+
+REGISTRY = [REQUEST_DURATION, REQUESTS_TOTAL, SQL_DURATION, SQL_ROWS, SLOW_QUERIES, TEMPLATE_RENDER]
+
+# Fontes de medidas instantâneas (pool, caches...): nome -> função que devolve um dict
+_GAUGE_SOURCES = {}
+
+_WHITESPACE = re.compile(r"\s+")
+# IN (?,?,...) com um marcador por id: lotes de tamanhos diferentes dividem o rótulo
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+
+
+def statement_label(sql):
+    """Rótulo estável para uma instrução: espaços e listas de marcadores colapsados, até 160 caracteres"""
+    texto = _PLACEHOLDER_LIST.sub("(?…)", _WHITESPACE.sub(" ", sql)).strip()
+    return texto if len(texto) <= 160 else texto[:157] + "..."
+
+
+def record_statement(sql, elapsed, rows):
+    rotulo = statement_label(sql)
+    SQL_DURATION.observe(elapsed, rotulo)
+    if rows:
+        SQL_ROWS.inc(rotulo, amount=rows)
+    if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+        SLOW_QUERIES.inc(rotulo)
+        slow_query_logger.warning("Consulta lenta (%.1f ms, %d linhas): %s", elapsed * 1000, rows, rotulo)
+
+
+def register_gauges(prefix, source):
+    """Exporta os valores numéricos de ``source()`` como gauges ``<prefix>_<chave>``"""
+    _GAUGE_SOURCES[prefix] = source
+
+
+def render():
+    pid = os.getpid()
+    linhas = []
+    for metrica in REGISTRY:
+        linhas.extend(metrica.render())
+    for prefix, source in sorted(_GAUGE_SOURCES.items()):
+        for chave, valor in sorted(source().items()):
+            if isinstance(valor, bool) or not isinstance(valor, (int, float)):
+                continue
+            nome = f"{prefix}_{chave}"
+            linhas.append(f"# TYPE {nome} gauge")
+            linhas.append(f'{nome}{{pid="{pid}"}} {valor}')
+    return "\n".join(linhas) + "\n"
+
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Migração em lote das senhas em texto plano para bcrypt.
+
+Calcula os hashes em paralelo, um processo por núcleo, e grava cada um só se
+a senha não tiver mudado nesse meio tempo. Hashes bcrypt com custo abaixo de
+BCRYPT_ROUNDS não podem ser refeitos sem a senha original: eles são listados
+e serão atualizados automaticamente no próximo login do usuário.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import bcrypt
+
+from passwords import BCRYPT_ROUNDS, bcrypt_cost, is_bcrypt_hash
+
+DATABASE = os.environ.get('PORTARIA_DB', 'portaria.db')
+
+def hash_senha(username, senha, rounds):
+    novo = bcrypt.hashpw(senha.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+    return username, senha, novo
+
+def migrate_passwords(rounds=BCRYPT_ROUNDS, workers=None, dry_run=False):
+    conn = sqlite3.connect(DATABASE)
+    usuarios = conn.execute("SELECT username, senha FROM usuarios ORDER BY username").fetchall()
+
+    texto_plano = [(u, s) for u, s in usuarios if not is_bcrypt_hash(s)]
+    custo_baixo = [u for u, s in usuarios if is_bcrypt_hash(s) and bcrypt_cost(s) < rounds]
+
+    print(f"👥 {len(usuarios)} usuário(s): {len(texto_plano)} em texto plano, "
+          f"{len(custo_baixo)} com bcrypt abaixo do custo {rounds}.")
+    for username in custo_baixo:
+        print(f"   ⏳ {username}: será regravado no próximo login")
+
+    if dry_run or not texto_plano:
+        conn.close()
+        return 0
+
+    inicio = time.perf_counter()
+    migrados = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(hash_senha, u, s, rounds) for u, s in texto_plano]
+        for n, future in enumerate(as_completed(futures), 1):
+            username, senha, novo = future.result()
+            cursor = conn.execute(
+                "UPDATE usuarios SET senha = ? WHERE username = ? AND senha = ?",
+                (novo, username, senha)
+            )
+            conn.commit()
+            if cursor.rowcount:
+                migrados += 1
+                status = "✓"
+            else:
+                status = "↷ senha alterada durante a migração, ignorado"
+            print(f"   [{n}/{len(texto_plano)}] {username} {status}")
+
+    conn.close()
+    print(f"✓ {migrados} senha(s) migrada(s) para bcrypt em {time.perf_counter() - inicio:.1f}s.")
+    return migrados
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Migra senhas em texto plano para bcrypt")
+    parser.add_argument('--rounds', type=int, default=BCRYPT_ROUNDS, help="custo do bcrypt")
+    parser.add_argument('--workers', type=int, default=None, help="processos (padrão: nº de núcleos)")
+    parser.add_argument('--dry-run', action='store_true', help="apenas lista o que seria migrado")
+    args = parser.parse_args()
+
+    if not os.path.exists(DATABASE):
+        print(f"❌ Arquivo '{DATABASE}' não encontrado!")
+        print("   Execute: python3 setup_database_bcrypt.py")
+        sys.exit(1)
+
+    migrate_passwords(args.rounds, args.workers, args.dry_run)
@@ -0,0 +1,169 @@
+"""
+Hash e verificação de senhas bcrypt fora da thread da requisição.
+
+O bcrypt é caro de propósito. No começo de turno, uma rajada de logins
+ocuparia todos os workers, então as operações passam por um pool de threads
+limitado (o bcrypt libera o GIL durante o cálculo) com um teto de tarefas
+pendentes. Acima do teto a chamada falha na hora com ``HashingBusy``, em vez
+de enfileirar sem limite.
+"""
+
+import hmac
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import bcrypt  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", str(os.cpu_count() or 2)))
+HASH_MAX_PENDING = int(os.environ.get("HASH_MAX_PENDING", str(HASH_WORKERS * 4)))
+HASH_TIMEOUT = float(os.environ.get("HASH_TIMEOUT", "10"))
+
+
+class HashingBusy(Exception):
+    """Fila de hashing cheia ou tempo de espera esgotado"""
+
+
+class HashingPool:
+    """Pool de threads limitado, com contagem de tarefas pendentes"""
+
+    def __init__(self, workers=HASH_WORKERS, max_pending=HASH_MAX_PENDING, timeout=HASH_TIMEOUT):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.busy_time = 0.0
+
+    def _get_executor(self):
+        # Threads não sobrevivem ao fork do gunicorn: cada worker cria o seu pool
+        if self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+            self._pid = os.getpid()
+            self.pending = 0
+        return self._executor
+
+    def _done(self, future):
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+
+    def _timed(self, fn, args):
+        inicio = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            duracao = time.perf_counter() - inicio
+            with self._lock:
+                self.busy_time += duracao
+
+    def run(self, fn, *args):
+        with self._lock:
+            executor = self._get_executor()
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HashingBusy("Fila de verificação de senhas cheia")
+            self.pending += 1
+        future = executor.submit(self._timed, fn, args)
+        future.add_done_callback(self._done)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            with self._lock:
+                self.timeouts += 1
+            raise HashingBusy("Tempo esgotado aguardando a verificação da senha")
+
+    def submit_background(self, fn, *args):
+        """Agenda uma tarefa sem esperar o resultado; False se a fila estiver cheia"""
+        with self._lock:
+            executor = self._get_executor()
+            if self.pending >= self.max_pending:
+                return False
+            self.pending += 1
+        future = executor.submit(self._timed, fn, args)
+        future.add_done_callback(self._done)
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self.pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "busy_time_total": round(self.busy_time, 6),
+            }
+
+
+hashing_pool = HashingPool()
+
+
+def _checkpw(password, hashed):
+    return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+
+
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=rounds)).decode("utf-8")
+
+
+BCRYPT_PREFIXES = ("$2a$", "$2b$", "$2y$")
+
+
+def is_bcrypt_hash(stored):
+    return stored.startswith(BCRYPT_PREFIXES)
+
+
+def bcrypt_cost(stored):
+    """Custo gravado no hash ("$2b$12$..." -> 12)"""
+    try:
+        return int(stored[4:6])
+    except ValueError:
+        return 0
+
+
+def needs_rehash(stored, rounds=None):
+    """Senha em texto plano (legado) ou hash com custo abaixo do configurado"""
+    return not is_bcrypt_hash(stored) or bcrypt_cost(stored) < (rounds or BCRYPT_ROUNDS)
+
+
+def verify_password(password, stored):
+    """Caminho único de verificação: bcrypt no pool ou comparação legada em texto plano"""
+    if is_bcrypt_hash(stored):
+        return check_password_bcrypt(password, stored)
+    return hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8"))
+
+
+def rehash_in_background(password, on_done, rounds=None):
+    """Gera o novo hash no pool, sem bloquear a requisição.
+
+    ``on_done(novo_hash)`` roda na thread do pool. Se a fila estiver cheia a
+    atualização fica para o próximo login.
+    """
+    def job():
+        try:
+            on_done(_hashpw(password, rounds or BCRYPT_ROUNDS))
+        except Exception:
+            logger.exception("Falha ao regravar hash de senha")
+    return hashing_pool.submit_background(job)
+
+
+def check_password_bcrypt(password, hashed):
+    """Verifica senha usando bcrypt (no pool de hashing)"""
+    return hashing_pool.run(_checkpw, password, hashed)
+
+
+def hash_password_bcrypt(password, rounds=None):
+    """Gera hash bcrypt para a senha (no pool de hashing)"""
+    return hashing_pool.run(_hashpw, password, rounds or BCRYPT_ROUNDS)
@@ -0,0 +1,44 @@
+"""
+Normalização de placas de veículos.
+
+A mesma placa aparece como "ABC-1234", "abc1234" ou, depois da conversão
+para o padrão Mercosul, "ABC1C34" (o 5º caractere vira letra: 0=A ... 9=J).
+A chave canônica une todas essas formas: maiúsculas, sem separadores e com
+a 5ª posição Mercosul convertida de volta para dígito. ``placa_chave`` e
+``placa_chave_sql`` precisam produzir exatamente o mesmo resultado.
+"""
+
+import re
+import string
+
+MERCOSUL_LETRAS = "ABCDEFGHIJ"
+
+_SEPARADORES = re.compile(r"[- ]")
+# upper() do SQLite só converte ASCII; a versão Python faz o mesmo
+_MAIUSCULAS = str.maketrans(string.ascii_lowercase, string.ascii_uppercase)
+
+
+# Início de placa Mercosul ("XYZ1C", enquanto se digita): também é convertido
+_MERCOSUL_PREFIXO = re.compile(r"[A-Z]{3}[0-9][A-J]")
+
+
+def placa_chave(placa):
+    """"ABC-1234", "abc1c34" -> "ABC1234"; prefixos também: "XYZ1C" -> "XYZ12\"
+
+    Para 7 caracteres a regra é a de ``placa_chave_sql`` (a chave gravada).
+    Com 5 ou 6 só há chave gravada de placa inteira, então a conversão vale
+    para o começo de placa Mercosul e a busca por prefixo encontra os dois
+    formatos.
+    """
+    p = _SEPARADORES.sub("", placa or "").translate(_MAIUSCULAS)
+    if (len(p) == 7 and p[4] in MERCOSUL_LETRAS) or (5 <= len(p) < 7 and _MERCOSUL_PREFIXO.match(p)):
+        p = p[:4] + str(MERCOSUL_LETRAS.index(p[4])) + p[5:]
+    return p
+
+
+def placa_chave_sql(expr):
+    """Expressão SQL equivalente a ``placa_chave`` aplicada a ``expr``"""
+    p = f"upper(replace(replace({expr}, '-', ''), ' ', ''))"
+    return (f"CASE WHEN length({p}) = 7 AND substr({p}, 5, 1) BETWEEN 'A' AND 'J' "
+            f"THEN substr({p}, 1, 4) || char(unicode(substr({p}, 5, 1)) - 17) || substr({p}, 6) "
+            f"ELSE {p} END")
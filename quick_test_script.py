@@ -3,16 +3,128 @@
 Script de teste rápido para verificar configuração do sistema admin
 """
 
+import os
 import sqlite3
+import tempfile
+import time
 import bcrypt
 
+from app import CONSULTA_PAGE_SIZE, build_consulta_where, get_consulta_filtros, page_sql
+from metrics import statement_label
+from writer import GroupCommitWriter
+from placas import placa_chave, placa_chave_sql
+
+def consulta_query(nome, **args):
+    """Página de consultar() montada pelos mesmos builders do app (banco principal)"""
+    where, params = build_consulta_where(get_consulta_filtros(args))
+    return nome, page_sql(where, "DESC"), tuple(params) + (CONSULTA_PAGE_SIZE + 1,)
+
+# Consultas quentes de dashboard(), consultar() e relatórios: nenhuma pode varrer a tabela
+HOT_QUERIES = [
+    ("Registros hoje",
+     "SELECT COUNT(*) FROM controle WHERE data_entrada = ?", ("2024-01-01",)),
+    ("Veículos dentro",
+     "SELECT COUNT(*) FROM controle WHERE data_saida = ''", ()),
+    consulta_query("Consulta por período", data_inicio="2024-01-01", data_fim="2024-01-31"),
+    consulta_query("Consulta por placa", placa="ABC-1234"),
+    consulta_query("Busca livre da consulta", q="silva"),
+    consulta_query("Consulta de veículos dentro", status="dentro"),
+    ("Última visita da placa",
+     "SELECT * FROM controle WHERE placa_chave = ? ORDER BY id DESC LIMIT 1", ("ABC1234",)),
+    ("Placa dentro do pátio",
+     "SELECT * FROM presenca WHERE placa_chave = ? ORDER BY registro_id DESC", ("ABC1234",)),
+    ("Entradas por dia (relatório)",
+     "SELECT data, sum(entradas) FROM resumo_diario WHERE data >= ? AND data <= ? GROUP BY data",
+     ("2024-01-01", "2024-12-31")),
+]
+
+def is_full_scan(detail):
+    # "SCAN controle USING INDEX ..." percorre um índice; "SCAN controle" puro é varredura completa
+    # (as páginas da consulta qualificam o esquema: "SCAN main.controle")
+    detail = detail.replace("SCAN main.", "SCAN ", 1)
+    return detail.startswith(("SCAN controle", "SCAN resumo_diario")) and "INDEX" not in detail
+
+def check_query_plans(cursor):
+    ok = True
+    for nome, sql, params in HOT_QUERIES:
+        plano = [row[3] for row in cursor.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        if any(is_full_scan(detail) for detail in plano):
+            print(f"  ✗ ERRO: '{nome}' varre a tabela inteira: {'; '.join(plano)}")
+            ok = False
+        else:
+            print(f"  ✓ {nome}: {'; '.join(plano)}")
+    return ok
+
+# Placa gravada -> o que o guarda digita no autocompletar: o prefixo deve achar a placa nos dois formatos
+PLACA_PREFIXOS = [
+    ("XYZ-1234", "XYZ1C"),
+    ("XYZ-1234", "xyz-1c3"),
+    ("XYZ1C34", "XYZ-12"),
+    ("XYZ1C34", "XYZ1C"),
+    ("XYZ1C34", "XYZ1"),
+]
+
+def check_placas(cursor):
+    ok = True
+    for gravada, digitado in PLACA_PREFIXOS:
+        # Chave como o banco grava (coluna gerada) contra a chave do prefixo (api_placas)
+        chave = cursor.execute(f"SELECT {placa_chave_sql(':p')}", {"p": gravada}).fetchone()[0]
+        prefixo = placa_chave(digitado)
+        if chave.startswith(prefixo):
+            print(f"  ✓ '{digitado}' encontra {gravada} ({prefixo} → {chave})")
+        else:
+            print(f"  ✗ ERRO: '{digitado}' ({prefixo}) não encontra {gravada} ({chave})")
+            ok = False
+    return ok
+
+def check_statement_labels():
+    # Uma série por instrução em /metrics, não uma por tamanho de lote do IN (?,?,...)
+    sql = "SELECT * FROM controle WHERE id IN ({})"
+    rotulos = {statement_label(sql.format(",".join("?" * n))) for n in (1, 2, 50, 1000)}
+    rotulos.add(statement_label(sql.format(", ".join(["?"] * 7))))
+    if len(rotulos) == 1:
+        print(f"  ✓ lotes de 1 a 1000 ids: {rotulos.pop()}")
+        return True
+    print(f"  ✗ ERRO: lotes de tamanhos diferentes geram {len(rotulos)} rótulos: {sorted(rotulos)}")
+    return False
+
+def check_writer_travado():
+    # Banco travado por outro processo: todas as escritas do grupo falham logo,
+    # inclusive as que nem começaram, em vez de esperar WRITE_TIMEOUT
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = os.path.join(pasta, "travado.db")
+        escritor = GroupCommitWriter(caminho, window=0.05)
+        escritor.run(lambda c: c.execute("CREATE TABLE t (x)"))
+        escritor.run(lambda c: c.execute("PRAGMA busy_timeout = 100"))
+        trava = sqlite3.connect(caminho, isolation_level=None)
+        trava.execute("BEGIN IMMEDIATE")
+        inicio = time.perf_counter()
+        futures = [escritor.submit(lambda c: c.execute("INSERT INTO t VALUES (1)")) for _ in range(3)]
+        erros = []
+        for future in futures:
+            try:
+                future.result(timeout=5)
+                erros.append(None)
+            except sqlite3.OperationalError as e:
+                erros.append(str(e))
+            except Exception as e:
+                erros.append(f"{type(e).__name__}: {e}")
+        trava.rollback()
+        trava.close()
+    decorrido = time.perf_counter() - inicio
+    if all(e and "locked" in e for e in erros):
+        print(f"  ✓ {len(futures)} escritas falharam em {decorrido:.2f}s: {erros[0]}")
+        return True
+    print(f"  ✗ ERRO: escritas com o banco travado: {erros}")
+    return False
+
 def test_database():
     print("=" * 60)
     print("TESTE DO SISTEMA ADMINISTRATIVO")
     print("=" * 60)
     
     try:
-        conn = sqlite3.connect('portaria.db')
+        conn = sqlite3.connect(os.environ.get('PORTARIA_DB', 'portaria.db'))
         cursor = conn.cursor()
         
         # Teste 1: Verificar tabela usuarios
@@ -71,6 +183,27 @@ def test_database():
             admin_status = "ADMIN" if user[1] == 1 else "Normal"
             print(f"  - {user[0]}: {admin_status}")
         
+        # Teste 6: Verificar planos das consultas quentes
+        print("\n✓ TESTE 6: Verificando planos de consulta (EXPLAIN QUERY PLAN)...")
+        if not check_query_plans(cursor):
+            print("\nSolução: Execute 'python3 setup_database_bcrypt.py' para aplicar as migrações")
+            return False
+        
+        # Teste 7: Prefixos de placa no autocompletar
+        print("\n✓ TESTE 7: Verificando prefixos de placa (antiga e Mercosul)...")
+        if not check_placas(cursor):
+            return False
+        
+        # Teste 8: Rótulos das métricas de SQL
+        print("\n✓ TESTE 8: Verificando rótulos das métricas de SQL...")
+        if not check_statement_labels():
+            return False
+        
+        # Teste 9: Escritor com o banco travado
+        print("\n✓ TESTE 9: Verificando o escritor com o banco travado...")
+        if not check_writer_travado():
+            return False
+        
         conn.close()
         
         print("\n" + "=" * 60)
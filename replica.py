@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Caminho de leitura das consultas, exportações e relatórios.
+
+As rotas da portaria (entrada, saída, dashboard, pátio) usam o pool do banco
+principal. Buscas, exportações e relatórios pegam a conexão daqui, de um
+pool separado, e nunca ocupam as vagas das rotas da portaria. LEITURA_MODO:
+
+- "primario" (padrão): o pool de leitura abre o próprio banco principal
+  somente para consulta. Em WAL cada leitura vê um snapshot consistente e
+  não bloqueia as escritas.
+- "replica": o pool lê uma cópia (REPLICA_DB) feita com a API de backup do
+  SQLite a cada REPLICA_INTERVALO segundos e trocada de uma vez com
+  ``os.replace``. Leituras longas deixam de segurar o checkpoint do WAL do
+  banco principal e de disputar o cache dele. Quem acabou de gravar lê do
+  principal até a cópia alcançar a sua escrita.
+
+Uso avulso (cron, por exemplo): python3 replica.py
+"""
+
+import fcntl
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from urllib.parse import quote
+
+import db
+
+LEITURA_MODO = os.environ.get("LEITURA_MODO", "primario")
+REPLICA_DB = os.environ.get("REPLICA_DB", os.path.splitext(db.DATABASE)[0] + "-replica.db")
+REPLICA_INTERVALO = float(os.environ.get("REPLICA_INTERVALO", "60"))
+LEITURA_POOL_SIZE = int(os.environ.get("LEITURA_POOL_SIZE", "4"))
+
+
+def idade(caminho=REPLICA_DB):
+    """Segundos desde o instante copiado em ``caminho``; None se ainda não há cópia"""
+    try:
+        return max(0.0, time.time() - os.stat(caminho).st_mtime)
+    except FileNotFoundError:
+        return None
+
+
+def atualizar(origem=None, destino=REPLICA_DB):
+    """Copia o banco principal para ``destino`` com a API de backup; devolve a duração.
+
+    A cópia é montada em um arquivo temporário e só então substitui a
+    anterior, então quem lê nunca vê uma cópia pela metade. O mtime da cópia
+    é o instante em que o backup começou.
+    """
+    inicio = time.perf_counter()
+    instante = time.time()
+    temporario = destino + ".tmp"
+    for sobra in (temporario, temporario + "-journal"):
+        if os.path.exists(sobra):
+            os.remove(sobra)
+    conn = db.connect(origem)
+    copia = sqlite3.connect(temporario)
+    try:
+        conn.backup(copia)
+        # A cópia é só lida: sem WAL ela não precisa dos arquivos -wal e -shm
+        copia.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        copia.close()
+        conn.close()
+    os.utime(temporario, (instante, instante))
+    os.replace(temporario, destino)
+    return time.perf_counter() - inicio
+
+
+class _ConexaoReplica(sqlite3.Connection):
+    """Conexão com a cópia, marcada com o arquivo (inode) que ela abriu"""
+
+    versao = None
+
+
+class LeituraPool(db.ConnectionPool):
+    """Pool de leitura no banco principal: as conexões não gravam (query_only)"""
+
+    def _connect(self):
+        conn = db.connect(self.database)
+        conn.execute("PRAGMA query_only = 1")
+        return conn
+
+
+class ReplicaPool(db.ConnectionPool):
+    """Pool da cópia.
+
+    A cópia antiga continua aberta por quem já a tinha (``os.replace`` não
+    apaga o conteúdo de um arquivo aberto), mas, depois da troca, conexões
+    ociosas são fechadas e as emprestadas são descartadas na devolução.
+    Como o arquivo de uma conexão nunca muda, ele é aberto como imutável,
+    sem travas.
+    """
+
+    def __init__(self, database, size):
+        super().__init__(database, size)
+        self._versao = None
+
+    def _connect(self):
+        versao = os.stat(self.database).st_ino
+        uri = "file:%s?immutable=1" % quote(os.path.abspath(self.database))
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, factory=_ConexaoReplica)
+        conn.row_factory = sqlite3.Row
+        for pragma in db.READ_PRAGMAS:
+            conn.execute(pragma)
+        conn.versao = versao
+        return conn
+
+    def acquire(self, scoped=False):
+        versao = os.stat(self.database).st_ino
+        if versao != self._versao:
+            self._versao = versao
+            self.discard_idle()
+        return super().acquire(scoped)
+
+    def release(self, conn):
+        if self._pid == os.getpid() and conn.versao != self._versao:
+            self.discard(conn)
+            return
+        super().release(conn)
+
+
+class Replicador:
+    """Thread que mantém a cópia com no máximo REPLICA_INTERVALO segundos.
+
+    Cada worker tem a sua, mas uma trava de arquivo faz só um deles copiar
+    por vez; os outros encontram a cópia nova e esperam a próxima rodada.
+    """
+
+    def __init__(self, origem=None, destino=REPLICA_DB, intervalo=REPLICA_INTERVALO):
+        self.origem = origem
+        self.destino = destino
+        self.intervalo = intervalo
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.atualizacoes = 0
+        self.falhas = 0
+        self.ultima_duracao = None
+        self.ultimo_erro = None
+
+    def iniciar(self):
+        # Como o escritor: a thread não sobrevive ao fork, cada worker inicia a sua
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="db-replica", daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+
+    def atualizar(self, forcar=False):
+        """Copia se a cópia passou do intervalo (ou se ``forcar``); devolve True se copiou"""
+        with open(self.destino + ".lock", "w") as trava:
+            if not forcar:
+                try:
+                    fcntl.flock(trava, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+                atual = idade(self.destino)
+                if atual is not None and atual < self.intervalo:
+                    return False
+            else:
+                fcntl.flock(trava, fcntl.LOCK_EX)
+            try:
+                self.ultima_duracao = atualizar(self.origem, self.destino)
+                self.atualizacoes += 1
+                self.ultimo_erro = None
+            except Exception as e:
+                self.falhas += 1
+                self.ultimo_erro = str(e)
+                raise
+        return True
+
+    def _loop(self):
+        while True:
+            try:
+                self.atualizar()
+            except Exception:
+                pass
+            time.sleep(max(1.0, self.intervalo / 10))
+
+
+leitura_pool = LeituraPool(size=LEITURA_POOL_SIZE)
+replica_pool = ReplicaPool(REPLICA_DB, size=LEITURA_POOL_SIZE)
+replicador = Replicador()
+
+
+def usa_replica(ultima_escrita=0):
+    """Se a leitura vai para a cópia: modo "replica" e cópia posterior à última escrita do usuário"""
+    if LEITURA_MODO != "replica":
+        return False
+    replicador.iniciar()
+    atual = idade()
+    return atual is not None and time.time() - atual > ultima_escrita
+
+
+def acquire(scoped=False, ultima_escrita=0):
+    """Conexão de leitura: da cópia ou, se ela não serve, do banco principal"""
+    if usa_replica(ultima_escrita):
+        try:
+            return replica_pool.acquire(scoped)
+        except FileNotFoundError:
+            pass
+    return leitura_pool.acquire(scoped)
+
+
+def versao(ultima_escrita=0):
+    """Versão dos dados que ``acquire`` leria (para ETags e chaves de cache)"""
+    if usa_replica(ultima_escrita):
+        return db.data_version(REPLICA_DB)
+    return db.data_version()
+
+
+def stats():
+    atual = idade() if LEITURA_MODO == "replica" else None
+    return {
+        "modo": LEITURA_MODO,
+        "intervalo": REPLICA_INTERVALO,
+        "atraso": round(atual, 1) if atual is not None else None,
+        "copiada_em": datetime.fromtimestamp(time.time() - atual).strftime("%d/%m/%Y %H:%M:%S") if atual is not None else "",
+        "atualizacoes": replicador.atualizacoes,
+        "falhas": replicador.falhas,
+        "ultima_duracao": round(replicador.ultima_duracao, 3) if replicador.ultima_duracao is not None else None,
+        "ultimo_erro": replicador.ultimo_erro or "",
+        "leitura_pool": leitura_pool.stats(),
+        "replica_pool": replica_pool.stats(),
+    }
+
+
+if __name__ == '__main__':
+    duracao = atualizar()
+    print(f"✓ Cópia de leitura atualizada em {REPLICA_DB} ({duracao:.1f} s).")
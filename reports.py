@@ -0,0 +1,239 @@
+"""
+Relatórios gerenciais de 'controle'.
+
+Entradas por dia, volumes por empresa/destino/tipo e permanência média vêm
+de 'resumo_diario' (mantido por triggers), com custo proporcional aos dias do
+período. O que precisa de cada visita (distribuição da permanência, mapa de
+chegadas por dia da semana e hora, permanências excessivas) é calculado com
+NumPy sobre colunas lidas em lote de 'controle', sem laço em Python por
+registro, e só para períodos de até RELATORIO_MAX_DIAS (incluindo os arquivos
+anuais de archive.py quando o período os alcança). O resultado fica em cache
+por período, filtros e versão dos dados.
+"""
+
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import archive
+import db
+from cache import TTLCache
+from datas import para_epoch
+
+RELATORIO_JANELA_DIAS = 31
+RELATORIO_MAX_DIAS = int(os.environ.get("RELATORIO_MAX_DIAS", "731"))
+RELATORIO_CACHE_TTL = float(os.environ.get("RELATORIO_CACHE_TTL", "300"))
+PERMANENCIA_LIMITE_HORAS = float(os.environ.get("PERMANENCIA_LIMITE_HORAS", "12"))
+
+FILTROS = ("empresa", "destino", "tipo")
+DIAS_SEMANA = ("Seg", "Ter", "Qua", "Qui", "Sex", "Sáb", "Dom")
+
+# Faixas do histograma de permanência, em minutos
+FAIXAS_PERMANENCIA = (0, 15, 30, 60, 120, 240, 480, 1440)
+TOP_VOLUMES = 20
+TOP_EXCESSOS = 50
+
+relatorio_cache = TTLCache(maxsize=64, ttl=RELATORIO_CACHE_TTL, name="relatorios")
+
+
+def filtros_sql(filtros):
+    where = ""
+    params = []
+    for campo in FILTROS:
+        if filtros.get(campo):
+            where += f" AND {campo} = ?"
+            params.append(filtros[campo])
+    return where, params
+
+
+# ==================== RESUMO DIÁRIO ====================
+
+def ler_resumo(conn, data_inicio, data_fim, filtros):
+    """Totais, entradas por dia e volumes do período a partir de 'resumo_diario'"""
+    where, params = filtros_sql(filtros)
+    where = "data >= ? AND data <= ?" + where
+    params = [data_inicio.isoformat(), data_fim.isoformat()] + params
+
+    por_dia = dict(conn.execute(
+        f"SELECT data, sum(entradas) FROM resumo_diario WHERE {where} GROUP BY data", params
+    ).fetchall())
+    entradas_por_dia = []
+    dia = data_inicio
+    while dia <= data_fim:
+        entradas_por_dia.append({"data": dia.isoformat(), "total": por_dia.get(dia.isoformat(), 0)})
+        dia += timedelta(days=1)
+
+    # Uma leitura agrupada por combinação; os totais por empresa, destino e
+    # tipo saem dela (poucas linhas) em vez de uma ordenação do período por campo
+    combinacoes = conn.execute(f"""
+        SELECT {', '.join(FILTROS)}, sum(entradas), sum(dentro), sum(saidas), sum(permanencia)
+        FROM resumo_diario WHERE {where} GROUP BY {', '.join(FILTROS)}
+    """, params).fetchall()
+    totais = [0, 0, 0, 0]
+    grupos = {campo: {} for campo in FILTROS}
+    for row in combinacoes:
+        valores = row[len(FILTROS):]
+        for i, valor in enumerate(valores):
+            totais[i] += valor
+        for campo, chave in zip(FILTROS, row):
+            soma = grupos[campo].setdefault(chave, [0, 0, 0, 0])
+            for i, valor in enumerate(valores):
+                soma[i] += valor
+
+    entradas, dentro, saidas, permanencia = totais
+    resumo = {
+        "entradas": entradas,
+        "dentro": dentro,
+        "saidas": saidas,
+        "permanencia_media": round(permanencia / saidas / 60, 1) if saidas else None,
+        "entradas_por_dia": entradas_por_dia,
+    }
+    for campo in FILTROS:
+        maiores = sorted(grupos[campo].items(), key=lambda item: (-item[1][0], item[0]))[:TOP_VOLUMES]
+        resumo[f"por_{campo}"] = [
+            {campo: valor or "(vazio)", "total": total, "dentro": dentro,
+             "permanencia_media": round(soma / saidas / 60, 1) if saidas else 0.0}
+            for valor, (total, dentro, saidas, soma) in maiores
+        ]
+    return resumo
+
+
+# ==================== DETALHE POR VISITA (NumPy) ====================
+
+def ler_colunas(conn, inicio, fim, filtros):
+    """id, entrada e saída (-1 se ainda dentro) dos registros com entrada em [inicio, fim).
+
+    Cada lote é uma janela de RELATORIO_JANELA_DIAS lida em uma única linha:
+    o SQLite concatena cada coluna (group_concat) e o NumPy converte o texto
+    de uma vez, sem criar um objeto Python por registro. Janelas anteriores
+    ao corte do arquivo também leem os arquivos anuais do período.
+    """
+    where, filtro_params = filtros_sql(filtros)
+    lotes = []
+    janela = RELATORIO_JANELA_DIAS * 86400
+    for de in range(inicio, fim, janela):
+        ate = min(de + janela, fim)
+        for esquema in archive.fontes(conn, de, ate):
+            textos = conn.execute(f"""
+                SELECT group_concat(id), group_concat(entrada_ts), group_concat(coalesce(saida_ts, -1))
+                FROM {esquema}.controle WHERE entrada_ts >= ? AND entrada_ts < ?{where}
+            """, [de, ate] + filtro_params).fetchone()
+            if textos[0] is not None:
+                lotes.append([np.fromstring(texto, dtype=np.int64, sep=",") for texto in textos])
+
+    nomes = ("id", "entrada", "saida")
+    if not lotes:
+        return {nome: np.empty(0, dtype=np.int64) for nome in nomes}
+    return {nome: np.concatenate(partes) for nome, partes in zip(nomes, zip(*lotes))}
+
+
+def com_saida(col):
+    """Máscara das visitas encerradas com saída coerente (não antes da entrada)"""
+    return col["saida"] >= col["entrada"]
+
+
+def permanencia(col):
+    """Histograma e percentis do tempo entre entrada e saída (minutos)"""
+    saiu = com_saida(col)
+    minutos = (col["saida"][saiu] - col["entrada"][saiu]) / 60.0
+    bordas = np.array(FAIXAS_PERMANENCIA + (np.inf,), dtype=float)
+    contagens, _ = np.histogram(minutos, bins=bordas)
+    faixas = []
+    for i, total in enumerate(contagens.tolist()):
+        de, ate = FAIXAS_PERMANENCIA[i], bordas[i + 1]
+        rotulo = f"{formatar_minutos(de)} a {formatar_minutos(ate)}" if np.isfinite(ate) else f"{formatar_minutos(de)} ou mais"
+        faixas.append({"faixa": rotulo, "total": total})
+    resumo = {"saidas": int(saiu.sum()), "faixas": faixas, "media": None, "p50": None, "p90": None, "p99": None}
+    if minutos.size:
+        p50, p90, p99 = np.percentile(minutos, [50, 90, 99]).tolist()
+        resumo.update(media=round(float(minutos.mean()), 1), p50=round(p50, 1),
+                      p90=round(p90, 1), p99=round(p99, 1))
+    return resumo
+
+
+def mapa_chegadas(col):
+    """Entradas por dia da semana (linhas, segunda primeiro) e hora do dia (colunas)"""
+    # 01/01/1970 foi uma quinta-feira: +3 faz a segunda-feira virar 0
+    dias = col["entrada"] // 86400
+    celula = ((dias + 3) % 7) * 24 + (col["entrada"] % 86400) // 3600
+    return np.bincount(celula, minlength=7 * 24).reshape(7, 24).tolist()
+
+
+def excessos(conn, col, agora, fontes=("main",), limite_horas=PERMANENCIA_LIMITE_HORAS):
+    """Permanências acima do limite: visitas encerradas e veículos ainda dentro"""
+    saiu = com_saida(col)
+    dentro = col["saida"] < 0
+    segundos = np.where(dentro, agora, col["saida"]) - col["entrada"]
+    acima = (saiu | dentro) & (segundos > limite_horas * 3600)
+    indices = np.flatnonzero(acima)
+    indices = indices[np.argsort(-segundos[indices], kind="stable")][:TOP_EXCESSOS].tolist()
+
+    # Só as linhas listadas voltam a 'controle' (e aos arquivos) para buscar os textos
+    ids = [int(col["id"][i]) for i in indices]
+    marcadores = ",".join("?" * len(ids))
+    textos = {}
+    for esquema in fontes if ids else ():
+        textos.update(
+            (row[0], row[1:])
+            for row in conn.execute(
+                f"SELECT id, {', '.join(FILTROS)} FROM {esquema}.controle WHERE id IN ({marcadores})", ids
+            )
+        )
+    return {
+        "limite_horas": limite_horas,
+        "total": int(acima.sum()),
+        "ainda_dentro": int((acima & dentro).sum()),
+        "registros": [
+            dict(zip(FILTROS, textos.get(id, ("",) * len(FILTROS))),
+                 id=id, entrada_ts=int(col["entrada"][i]),
+                 saida_ts=int(col["saida"][i]) if saiu[i] else None,
+                 horas=round(float(segundos[i]) / 3600, 1))
+            for id, i in zip(ids, indices)
+        ],
+    }
+
+
+# ==================== RELATÓRIO ====================
+
+def gerar_relatorio(conn, data_inicio, data_fim, filtros=None, agora=None):
+    """Relatório do período [data_inicio, data_fim] (datas, dia final inteiro).
+
+    Acima de RELATORIO_MAX_DIAS só o resumo diário é usado ("detalhado": False).
+    """
+    filtros = {campo: (filtros or {}).get(campo, "") for campo in FILTROS}
+    relatorio = {
+        "data_inicio": data_inicio.isoformat(),
+        "data_fim": data_fim.isoformat(),
+        "filtros": {campo: valor for campo, valor in filtros.items() if valor},
+        "detalhado": (data_fim - data_inicio).days < RELATORIO_MAX_DIAS,
+    }
+    relatorio.update(ler_resumo(conn, data_inicio, data_fim, filtros))
+    if relatorio["detalhado"]:
+        inicio = para_epoch(data_inicio)
+        fim = para_epoch(data_fim + timedelta(days=1))
+        col = ler_colunas(conn, inicio, fim, filtros)
+        relatorio.update(
+            permanencia=permanencia(col),
+            mapa_chegadas=mapa_chegadas(col),
+            excessos=excessos(conn, col, para_epoch(agora or datetime.now()), archive.fontes(conn, inicio, fim)),
+        )
+    return relatorio
+
+
+def obter_relatorio(conn, data_inicio, data_fim, filtros=None, versao=None):
+    """``gerar_relatorio`` com cache por período, filtros e versão dos dados.
+
+    ``versao`` é a versão do banco que ``conn`` lê (padrão: o principal).
+    """
+    filtros = {campo: (filtros or {}).get(campo, "") for campo in FILTROS}
+    chave = (data_inicio, data_fim, tuple(filtros.values()), versao or db.data_version())
+    return relatorio_cache.get_or_set(chave, lambda: gerar_relatorio(conn, data_inicio, data_fim, filtros))
+
+
+def formatar_minutos(minutos):
+    if minutos < 60:
+        return f"{minutos:.0f} min"
+    if minutos < 1440:
+        return f"{minutos / 60:.0f} h"
+    return f"{minutos / 1440:.0f} d"
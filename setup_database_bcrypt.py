@@ -6,9 +6,13 @@ Força o uso de bcrypt para todas as senhas.
 
 import sqlite3
 import os
+import sys
 import bcrypt
 
-DATABASE = 'portaria.db'
+from datas import de_epoch, normalizar_data, normalizar_hora, timestamp_sql
+from placas import placa_chave_sql
+
+DATABASE = os.environ.get('PORTARIA_DB', 'portaria.db')
 
 def get_db_connection():
     conn = sqlite3.connect(DATABASE)
@@ -17,7 +21,8 @@ def get_db_connection():
 
 def hash_password_bcrypt(password):
     """Gera hash bcrypt para a senha"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    rounds = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
 
 def create_tables():
     conn = get_db_connection()
@@ -87,20 +92,514 @@ def create_tables():
     conn.close()
     print("✓ Tabelas criadas/verificadas com sucesso.")
 
-def add_missing_columns():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Adicionar is_admin se não existir
+# ==================== MIGRAÇÕES ====================
+# Cada migração recebe um cursor e roda dentro de uma transação. A versão
+# aplicada fica gravada em PRAGMA user_version, então cada passo executa uma
+# única vez por banco. Novas migrações entram sempre no fim da lista.
+
+def migration_is_admin(cursor):
+    # Bancos antigos foram criados sem a coluna is_admin
     cursor.execute("PRAGMA table_info(usuarios)")
     columns = [column[1] for column in cursor.fetchall()]
     if 'is_admin' not in columns:
-        print("🔄 Adicionando coluna 'is_admin' à tabela 'usuarios'...")
         cursor.execute("ALTER TABLE usuarios ADD COLUMN is_admin INTEGER DEFAULT 0")
-        conn.commit()
-        print("✓ Coluna 'is_admin' adicionada.")
 
+def migration_controle_indexes(cursor):
+    # Registros do dia e buscas por período (dashboard e consultar)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_controle_data_entrada ON controle(data_entrada)")
+    # Veículos ainda dentro do pátio: índice parcial, só contém as linhas sem saída
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_controle_dentro ON controle(id) WHERE data_saida = ''")
+
+# Colunas de 'controle' indexadas na busca textual. A placa entra sem traço e
+# espaços, para que "ABC1234" encontre "ABC-1234".
+FTS_COLUMNS = ('nome', 'empresa', 'placa', 'destino', 'obs', 'n_nota')
+
+def fts_values(prefix):
+    return ", ".join(
+        f"replace(replace(upper({prefix}.placa), '-', ''), ' ', '')" if col == 'placa' else f"{prefix}.{col}"
+        for col in FTS_COLUMNS
+    )
+
+def migration_controle_fts(cursor):
+    # Índice FTS5 paralelo a 'controle' (rowid = controle.id), sem acentos e com
+    # índices de prefixo para a busca enquanto se digita
+    cursor.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS controle_fts USING fts5(
+            {', '.join(FTS_COLUMNS)},
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS controle_fts_insert AFTER INSERT ON controle BEGIN
+            INSERT INTO controle_fts(rowid, {', '.join(FTS_COLUMNS)})
+            VALUES (new.id, {fts_values('new')});
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS controle_fts_delete AFTER DELETE ON controle BEGIN
+            DELETE FROM controle_fts WHERE rowid = old.id;
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS controle_fts_update
+        AFTER UPDATE OF {', '.join(FTS_COLUMNS)} ON controle BEGIN
+            DELETE FROM controle_fts WHERE rowid = old.id;
+            INSERT INTO controle_fts(rowid, {', '.join(FTS_COLUMNS)})
+            VALUES (new.id, {fts_values('new')});
+        END
+    """)
+    rebuild_fts(cursor)
+
+def rebuild_fts(cursor):
+    """Recria o índice de busca textual a partir de 'controle'"""
+    cursor.execute("DELETE FROM controle_fts")
+    cursor.execute(f"""
+        INSERT INTO controle_fts(rowid, {', '.join(FTS_COLUMNS)})
+        SELECT id, {fts_values('controle')} FROM controle
+    """)
+    cursor.execute("INSERT INTO controle_fts(controle_fts) VALUES ('optimize')")
+
+def migration_controle_contadores(cursor):
+    # Contadores do dashboard mantidos por triggers: a leitura vira uma busca
+    # por chave primária em vez de COUNT(*) sobre 'controle'
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS contadores (
+            chave TEXT PRIMARY KEY,
+            valor INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS contagem_diaria (
+            data TEXT PRIMARY KEY,
+            entradas INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO contadores (chave, valor) VALUES ('veiculos_dentro', 0)")
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS controle_contadores_insert AFTER INSERT ON controle BEGIN
+            INSERT INTO contagem_diaria (data, entradas) VALUES (new.data_entrada, 1)
+                ON CONFLICT(data) DO UPDATE SET entradas = entradas + 1;
+            UPDATE contadores SET valor = valor + 1
+                WHERE chave = 'veiculos_dentro' AND new.data_saida = '';
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS controle_contadores_delete AFTER DELETE ON controle BEGIN
+            UPDATE contagem_diaria SET entradas = entradas - 1 WHERE data = old.data_entrada;
+            UPDATE contadores SET valor = valor - 1
+                WHERE chave = 'veiculos_dentro' AND old.data_saida = '';
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS controle_contadores_update
+        AFTER UPDATE OF data_entrada, data_saida ON controle BEGIN
+            UPDATE contagem_diaria SET entradas = entradas - 1
+                WHERE data = old.data_entrada AND old.data_entrada != new.data_entrada;
+            INSERT INTO contagem_diaria (data, entradas)
+                SELECT new.data_entrada, 1 WHERE old.data_entrada != new.data_entrada
+                ON CONFLICT(data) DO UPDATE SET entradas = entradas + 1;
+            UPDATE contadores SET valor = valor + (new.data_saida = '') - (old.data_saida = '')
+                WHERE chave = 'veiculos_dentro';
+        END
+    """)
+    reconcile_counters(cursor)
+
+def reconcile_counters(cursor):
+    """Recalcula os contadores a partir de 'controle'; retorna as divergências"""
+    divergencias = []
+
+    real = cursor.execute("SELECT COUNT(*) FROM controle WHERE data_saida = ''").fetchone()[0]
+    atual = cursor.execute("SELECT valor FROM contadores WHERE chave = 'veiculos_dentro'").fetchone()[0]
+    if real != atual:
+        divergencias.append(('veiculos_dentro', atual, real))
+        cursor.execute("UPDATE contadores SET valor = ? WHERE chave = 'veiculos_dentro'", (real,))
+
+    # Dias já arquivados não têm mais todas as linhas em 'controle': ficam como estão
+    corte = data_corte_arquivo(cursor)
+    reais = dict(cursor.execute(
+        "SELECT data_entrada, COUNT(*) FROM controle WHERE data_entrada >= ? GROUP BY data_entrada", (corte,)
+    ).fetchall())
+    atuais = dict(cursor.execute("SELECT data, entradas FROM contagem_diaria WHERE data >= ?", (corte,)).fetchall())
+    for data in set(reais) | set(atuais):
+        if reais.get(data, 0) != atuais.get(data, 0):
+            divergencias.append((f'entradas {data}', atuais.get(data, 0), reais.get(data, 0)))
+    if divergencias:
+        cursor.execute("DELETE FROM contagem_diaria WHERE data >= ?", (corte,))
+        cursor.executemany(
+            "INSERT INTO contagem_diaria (data, entradas) VALUES (?, ?)", reais.items()
+        )
+    return divergencias
+
+def migration_controle_eventos(cursor):
+    # Log de movimentações para o feed ao vivo (SSE). Preenchido por triggers,
+    # então entradas/saídas gravadas por qualquer worker ou script aparecem.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS eventos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo TEXT NOT NULL,
+            registro_id INTEGER NOT NULL,
+            criado_em TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS controle_eventos_insert AFTER INSERT ON controle BEGIN
+            INSERT INTO eventos (tipo, registro_id) VALUES ('entrada', new.id);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS controle_eventos_update AFTER UPDATE ON controle BEGIN
+            INSERT INTO eventos (tipo, registro_id) VALUES (
+                CASE WHEN old.data_saida = '' AND new.data_saida != '' THEN 'saida' ELSE 'alteracao' END,
+                new.id
+            );
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS controle_eventos_delete AFTER DELETE ON controle BEGIN
+            INSERT INTO eventos (tipo, registro_id) VALUES ('exclusao', old.id);
+        END
+    """)
+
+PRESENCA_COLUNAS = ("placa", "destino", "tipo", "empresa", "nome", "data_entrada", "hora_entrada")
+
+def presenca_insert_sql(prefix):
+    """INSERT em 'presenca' a partir da linha ``prefix`` (new, ou c num SELECT)"""
+    return f"""
+        INSERT OR REPLACE INTO presenca (registro_id, placa_chave, {', '.join(PRESENCA_COLUNAS)})
+        SELECT {prefix}.id, {placa_chave_sql(prefix + '.placa')}, {', '.join(prefix + '.' + c for c in PRESENCA_COLUNAS)}
+    """
+
+def migration_presenca(cursor):
+    # Quem está dentro agora, mantido por triggers: a lista, as contagens por
+    # destino/empresa e a busca por placa leem só os veículos no pátio
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS presenca (
+            registro_id INTEGER PRIMARY KEY,
+            placa_chave TEXT NOT NULL,
+            {', '.join(c + ' TEXT NOT NULL' for c in PRESENCA_COLUNAS)}
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_presenca_placa ON presenca(placa_chave)")
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS controle_presenca_insert
+        AFTER INSERT ON controle WHEN new.data_saida = '' BEGIN
+            {presenca_insert_sql('new')};
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS controle_presenca_update
+        AFTER UPDATE OF data_saida, {', '.join(PRESENCA_COLUNAS)} ON controle BEGIN
+            DELETE FROM presenca WHERE registro_id = old.id;
+            {presenca_insert_sql('new')} WHERE new.data_saida = '';
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS controle_presenca_delete AFTER DELETE ON controle BEGIN
+            DELETE FROM presenca WHERE registro_id = old.id;
+        END
+    """)
+    reconcile_presenca(cursor)
+
+def reconcile_presenca(cursor):
+    """Confere 'presenca' com as entradas em aberto de 'controle'; retorna as divergências"""
+    faltando = cursor.execute("""
+        SELECT count(*) FROM (
+            SELECT id FROM controle WHERE data_saida = '' EXCEPT SELECT registro_id FROM presenca
+        )
+    """).fetchone()[0]
+    sobrando = cursor.execute("""
+        SELECT count(*) FROM (
+            SELECT registro_id FROM presenca EXCEPT SELECT id FROM controle WHERE data_saida = ''
+        )
+    """).fetchone()[0]
+    if not faltando and not sobrando:
+        return []
+    atual = cursor.execute("SELECT count(*) FROM presenca").fetchone()[0]
+    cursor.execute("DELETE FROM presenca")
+    cursor.execute(presenca_insert_sql("c") + " FROM controle c WHERE c.data_saida = ''")
+    real = cursor.execute("SELECT count(*) FROM presenca").fetchone()[0]
+    return [("presenca", atual, real)]
+
+def migration_controle_placa_chave(cursor):
+    # Placa normalizada como coluna gerada (VIRTUAL: não ocupa espaço na
+    # tabela, só no índice) para busca exata e autocompletar por prefixo
+    colunas = [row[1] for row in cursor.execute("PRAGMA table_xinfo(controle)").fetchall()]
+    if 'placa_chave' not in colunas:
+        cursor.execute(f"""
+            ALTER TABLE controle ADD COLUMN placa_chave TEXT
+            GENERATED ALWAYS AS ({placa_chave_sql('placa')}) VIRTUAL
+        """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_controle_placa_chave ON controle(placa_chave, id)")
+
+def normalizar_datas_controle(cursor):
+    """Reescreve em ISO as datas e horas de 'controle' gravadas em outros formatos"""
+    iso = "'[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'"
+    hora = "'[0-9][0-9]:[0-9][0-9]*'"
+    rows = cursor.execute(f"""
+        SELECT id, data_entrada, hora_entrada, data_saida, hora_saida FROM controle
+        WHERE data_entrada NOT GLOB {iso} OR (hora_entrada != '' AND hora_entrada NOT GLOB {hora})
+           OR (data_saida != '' AND data_saida NOT GLOB {iso})
+           OR (hora_saida != '' AND hora_saida NOT GLOB {hora})
+    """).fetchall()
+    # O que não for reconhecido fica como está (e sem instante)
+    for id, data_entrada, hora_entrada, data_saida, hora_saida in rows:
+        cursor.execute("""
+            UPDATE controle SET data_entrada = ?, hora_entrada = ?, data_saida = ?, hora_saida = ?
+            WHERE id = ?
+        """, (
+            normalizar_data(data_entrada) or data_entrada, normalizar_hora(hora_entrada) or hora_entrada,
+            normalizar_data(data_saida) or data_saida, normalizar_hora(hora_saida) or hora_saida, id
+        ))
+
+def migration_controle_timestamps(cursor):
+    # Entrada e saída como instantes inteiros (colunas geradas a partir do
+    # texto, então nunca divergem dele): filtros por período viram busca por
+    # faixa no índice e o tempo de permanência é saida_ts - entrada_ts
+    normalizar_datas_controle(cursor)
+    colunas = [row[1] for row in cursor.execute("PRAGMA table_xinfo(controle)").fetchall()]
+    for coluna, data, hora in (("entrada_ts", "data_entrada", "hora_entrada"),
+                               ("saida_ts", "data_saida", "hora_saida")):
+        if coluna not in colunas:
+            cursor.execute(f"""
+                ALTER TABLE controle ADD COLUMN {coluna} INTEGER
+                GENERATED ALWAYS AS ({timestamp_sql(data, hora)}) VIRTUAL
+            """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_controle_entrada_ts ON controle(entrada_ts)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_controle_saida_ts ON controle(saida_ts) WHERE saida_ts IS NOT NULL")
+    colunas = [row[1] for row in cursor.execute("PRAGMA table_xinfo(presenca)").fetchall()]
+    if "entrada_ts" not in colunas:
+        cursor.execute(f"""
+            ALTER TABLE presenca ADD COLUMN entrada_ts INTEGER
+            GENERATED ALWAYS AS ({timestamp_sql('data_entrada', 'hora_entrada')}) VIRTUAL
+        """)
+
+def migration_controle_entrada_saida(cursor):
+    # Relatórios leem entrada e saída de cada registro do período: com
+    # saida_ts no índice, o SQLite não recalcula a coluna gerada por linha.
+    # O índice novo também atende às buscas só por entrada_ts.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_controle_entrada_saida ON controle(entrada_ts, saida_ts)")
+    cursor.execute("DROP INDEX IF EXISTS idx_controle_entrada_ts")
+
+# Resumo diário de 'controle' por dia de entrada, destino, tipo e empresa.
+# Uma linha de 'controle' contribui com uma entrada, com "dentro" enquanto não
+# tem saída e, depois da saída, com a permanência em segundos.
+RESUMO_CHAVE = ("data", "destino", "tipo", "empresa")
+RESUMO_VALORES = ("entradas", "dentro", "saidas", "permanencia")
+
+def resumo_valores_sql(prefix):
+    """Contribuição da linha ``prefix`` para cada coluna de RESUMO_VALORES"""
+    saiu = f"coalesce({prefix}.saida_ts >= {prefix}.entrada_ts, 0)"
+    return (
+        "1",
+        f"({prefix}.data_saida = '')",
+        saiu,
+        f"CASE WHEN {saiu} THEN {prefix}.saida_ts - {prefix}.entrada_ts ELSE 0 END",
+    )
+
+def resumo_delta_sql(prefix, sinal):
+    """Soma (sinal 1) ou subtrai (sinal -1) a linha ``prefix`` do resumo"""
+    chave = (f"{prefix}.data_entrada", f"{prefix}.destino", f"{prefix}.tipo", f"{prefix}.empresa")
+    valores = ", ".join(f"{sinal} * {v}" for v in resumo_valores_sql(prefix))
+    return f"""
+        INSERT INTO resumo_diario ({', '.join(RESUMO_CHAVE + RESUMO_VALORES)})
+        VALUES ({', '.join(chave)}, {valores})
+        ON CONFLICT({', '.join(RESUMO_CHAVE)}) DO UPDATE SET
+            {', '.join(f"{c} = {c} + excluded.{c}" for c in RESUMO_VALORES)};
+        DELETE FROM resumo_diario
+            WHERE {' AND '.join(f"{c} = {v}" for c, v in zip(RESUMO_CHAVE, chave))} AND entradas = 0
+    """
+
+def migration_resumo_diario(cursor):
+    # Estatísticas históricas (entradas por dia, volumes, permanência média)
+    # lidas de um resumo mantido por triggers: o custo cresce com os dias do
+    # período, não com as movimentações
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS resumo_diario (
+            {', '.join(c + ' TEXT NOT NULL' for c in RESUMO_CHAVE)},
+            {', '.join(c + ' INTEGER NOT NULL DEFAULT 0' for c in RESUMO_VALORES)},
+            PRIMARY KEY ({', '.join(RESUMO_CHAVE)})
+        ) WITHOUT ROWID
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS controle_resumo_insert AFTER INSERT ON controle BEGIN
+            {resumo_delta_sql('new', 1)};
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS controle_resumo_update
+        AFTER UPDATE OF data_entrada, hora_entrada, data_saida, hora_saida, destino, tipo, empresa
+        ON controle BEGIN
+            {resumo_delta_sql('old', -1)};
+            {resumo_delta_sql('new', 1)};
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS controle_resumo_delete AFTER DELETE ON controle BEGIN
+            {resumo_delta_sql('old', -1)};
+        END
+    """)
+    rebuild_resumo(cursor)
+
+def rebuild_resumo(cursor):
+    """Recalcula 'resumo_diario' a partir de 'controle' (os dias já arquivados ficam como estão)"""
+    corte = data_corte_arquivo(cursor)
+    cursor.execute("DELETE FROM resumo_diario WHERE data >= ?", (corte,))
+    cursor.execute(f"""
+        INSERT INTO resumo_diario ({', '.join(RESUMO_CHAVE + RESUMO_VALORES)})
+        SELECT data_entrada, destino, tipo, empresa,
+               {', '.join(f"sum({v})" for v in resumo_valores_sql('c'))}
+        FROM controle c WHERE data_entrada >= ? GROUP BY data_entrada, destino, tipo, empresa
+    """, (corte,))
+
+# Arquivo de movimentações antigas (archive.py). Enquanto as linhas são movidas
+# para o arquivo do ano, 'arquivando' vale 1 dentro da mesma transação e os
+# triggers de exclusão não descontam contadores, resumo nem publicam eventos:
+# as linhas continuam existindo, só mudaram de arquivo. 'arquivado_ate' guarda
+# o instante de corte (entradas anteriores já podem estar no arquivo).
+NAO_ARQUIVANDO = "NOT coalesce((SELECT valor FROM contadores WHERE chave = 'arquivando'), 0)"
+
+def data_corte_arquivo(cursor):
+    """Dia ("AAAA-MM-DD") a partir do qual 'controle' está completo; '' sem arquivo"""
+    row = cursor.execute("SELECT valor FROM contadores WHERE chave = 'arquivado_ate'").fetchone()
+    return de_epoch(row[0]).date().isoformat() if row and row[0] else ''
+
+def migration_arquivo(cursor):
+    cursor.execute("INSERT OR IGNORE INTO contadores (chave, valor) VALUES ('arquivando', 0)")
+    cursor.execute("INSERT OR IGNORE INTO contadores (chave, valor) VALUES ('arquivado_ate', 0)")
+    for trigger in ("controle_contadores_delete", "controle_eventos_delete", "controle_resumo_delete"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute(f"""
+        CREATE TRIGGER controle_contadores_delete AFTER DELETE ON controle WHEN {NAO_ARQUIVANDO} BEGIN
+            UPDATE contagem_diaria SET entradas = entradas - 1 WHERE data = old.data_entrada;
+            UPDATE contadores SET valor = valor - 1
+                WHERE chave = 'veiculos_dentro' AND old.data_saida = '';
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER controle_eventos_delete AFTER DELETE ON controle WHEN {NAO_ARQUIVANDO} BEGIN
+            INSERT INTO eventos (tipo, registro_id) VALUES ('exclusao', old.id);
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER controle_resumo_delete AFTER DELETE ON controle WHEN {NAO_ARQUIVANDO} BEGIN
+            {resumo_delta_sql('old', -1)};
+        END
+    """)
+
+MIGRATIONS = [
+    (1, "Coluna 'is_admin' em 'usuarios'", migration_is_admin),
+    (2, "Índices de 'controle' (data_entrada e veículos dentro)", migration_controle_indexes),
+    (3, "Busca textual (FTS5) em 'controle'", migration_controle_fts),
+    (4, "Contadores do dashboard mantidos por triggers", migration_controle_contadores),
+    (5, "Log de eventos de 'controle' para o feed ao vivo", migration_controle_eventos),
+    (6, "Tabela 'presenca' (veículos dentro) mantida por triggers", migration_presenca),
+    (7, "Placa normalizada indexada em 'controle'", migration_controle_placa_chave),
+    (8, "Instantes de entrada e saída indexados em 'controle'", migration_controle_timestamps),
+    (9, "Índice de entrada e saída para os relatórios", migration_controle_entrada_saida),
+    (10, "Resumo diário por destino, tipo e empresa mantido por triggers", migration_resumo_diario),
+    (11, "Arquivo de movimentações antigas (triggers de exclusão)", migration_arquivo),
+]
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def run_migrations(conn=None, verbose=True):
+    """Aplica, em ordem, as migrações ainda não registradas no banco"""
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+
+    # Conexão em modo autocommit: as transações são abertas explicitamente
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    applied = []
+    try:
+        current = get_schema_version(conn)
+        for version, description, migration in MIGRATIONS:
+            if version <= current:
+                continue
+            if verbose:
+                print(f"🔄 Migração {version}: {description}...")
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                migration(cursor)
+                cursor.execute(f"PRAGMA user_version = {int(version)}")
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            applied.append(version)
+        if applied:
+            conn.execute("PRAGMA optimize")
+    finally:
+        conn.isolation_level = isolation_level
+        if own_conn:
+            conn.close()
+
+    if verbose:
+        if applied:
+            print(f"✓ Migrações aplicadas: {', '.join(str(v) for v in applied)}.")
+        else:
+            print("✓ Banco de dados já está na versão mais recente.")
+    return applied
+
+def rebuild_search_index():
+    """Comando avulso: reconstrói controle_fts em um banco existente"""
+    conn = get_db_connection()
+    conn.isolation_level = None
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        rebuild_fts(cursor)
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    total = cursor.execute("SELECT COUNT(*) FROM controle_fts").fetchone()[0]
+    conn.close()
+    print(f"✓ Índice de busca reconstruído ({total} registros).")
+
+def rebuild_daily_summary():
+    """Comando avulso: recalcula resumo_diario (carga do histórico ou conferência)"""
+    conn = get_db_connection()
+    conn.isolation_level = None
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        rebuild_resumo(cursor)
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    total, dias = cursor.execute("SELECT COUNT(*), COUNT(DISTINCT data) FROM resumo_diario").fetchone()
     conn.close()
+    print(f"✓ Resumo diário reconstruído ({total} linhas em {dias} dias).")
+
+def reconcile_dashboard_counters(verbose=True):
+    """Confere os contadores do dashboard e a tabela 'presenca' com 'controle' e corrige"""
+    conn = get_db_connection()
+    conn.isolation_level = None
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        divergencias = reconcile_counters(cursor) + reconcile_presenca(cursor)
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    if verbose:
+        for chave, atual, real in divergencias:
+            print(f"⚠️  Contador '{chave}' corrigido: {atual} → {real}")
+        print("✓ Contadores do dashboard conferidos.")
+    return divergencias
+
+def add_missing_columns():
+    """Mantido por compatibilidade: agora delega ao executor de migrações"""
+    return run_migrations()
 
 def insert_default_users():
     conn = get_db_connection()
@@ -201,16 +700,34 @@ def insert_default_users():
 
 
 if __name__ == '__main__':
+    if '--rebuild-fts' in sys.argv[1:]:
+        run_migrations()
+        rebuild_search_index()
+        sys.exit(0)
+
+    if '--rebuild-resumo' in sys.argv[1:]:
+        run_migrations()
+        rebuild_daily_summary()
+        sys.exit(0)
+
+    if '--reconcile' in sys.argv[1:]:
+        run_migrations()
+        reconcile_dashboard_counters()
+        sys.exit(0)
+
     print("🔧 Iniciando configuração do banco de dados com BCRYPT...")
     
     # 1. Criar/Verificar tabelas
     create_tables()
     
-    # 2. Adicionar colunas ausentes (como is_admin)
-    add_missing_columns()
+    # 2. Aplicar migrações pendentes (colunas ausentes, índices...)
+    run_migrations()
     
     # 3. Inserir usuários padrão
     insert_default_users()
+
+    # 4. Conferir contadores do dashboard
+    reconcile_dashboard_counters()
     
     print("\n🎉 Configuração do banco de dados concluída!")
     print("\n📝 Credenciais dos usuários padrão:")
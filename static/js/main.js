@@ -60,21 +60,6 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
-    // Busca em tempo real para tabelas
-    const searchInputs = document.querySelectorAll('.table-search');
-    searchInputs.forEach(function(input) {
-        input.addEventListener('keyup', function() {
-            const filter = this.value.toLowerCase();
-            const table = document.querySelector(this.dataset.target);
-            const rows = table.querySelectorAll('tbody tr');
-
-            rows.forEach(function(row) {
-                const text = row.textContent.toLowerCase();
-                row.style.display = text.includes(filter) ? '' : 'none';
-            });
-        });
-    });
-
     // Atualizar campos de placa automaticamente (maiúsculo)
     const placaInputs = document.querySelectorAll('input[name="placa"]');
     placaInputs.forEach(function(input) {
@@ -145,9 +130,71 @@ window.printReport = function() {
     window.print();
 };
 
-// Função para exportar dados (pode ser expandida)
-window.exportData = function(format) {
-    alert('Funcionalidade de exportação em desenvolvimento para o formato: ' + format);
+// Consulta periódica de uma API JSON com ETag: respostas 304 não chegam a
+// chamar onChange. Pausa enquanto a aba está oculta. A url pode ser uma
+// função (URL que muda com a página). Devolve {atualizar} para forçar uma
+// consulta imediata.
+window.pollJSON = function(url, interval, onChange) {
+    let etag = null;
+    let timer = null;
+    let parado = false;
+
+    function agendar() {
+        clearTimeout(timer);
+        timer = setTimeout(consultar, interval * 1000);
+    }
+
+    function consultar() {
+        if (document.hidden || parado) {
+            return;
+        }
+        const headers = {'Accept': 'application/json'};
+        if (etag) {
+            headers['If-None-Match'] = etag;
+        }
+        fetch(typeof url === 'function' ? url() : url, {headers: headers, cache: 'no-store', credentials: 'same-origin'})
+            .then(function(response) {
+                // Sessão expirada: o login redireciona para a página inicial
+                if (response.redirected) {
+                    parado = true;
+                    return;
+                }
+                if (response.status === 200) {
+                    etag = response.headers.get('ETag');
+                    return response.json().then(onChange);
+                }
+            })
+            .catch(function() {})
+            .finally(function() {
+                if (!parado) {
+                    agendar();
+                }
+            });
+    }
+
+    document.addEventListener('visibilitychange', function() {
+        if (!document.hidden) {
+            consultar();
+        }
+    });
+    agendar();
+    return {atualizar: consultar};
+};
+
+// Escapa texto para montar HTML
+window.escapeHTML = function(texto) {
+    const div = document.createElement('div');
+    div.textContent = texto == null ? '' : String(texto);
+    return div.innerHTML;
+};
+
+// "2025-01-02", "10:00:37" -> "02/01/2025 10:00": sempre sem os segundos,
+// como o filtro datahora_br (datas.py) nas linhas renderizadas pelo servidor
+window.formatDataHoraBR = function(data, hora) {
+    if (!data || !hora) return '';
+    const partes = data.split('-');
+    const [h, m] = hora.split(':');
+    return `${partes[2]}/${partes[1]}/${partes[0]} ${h.padStart(2, '0')}:${(m || '00').padStart(2, '0')}`;
 };
 
 // Função para atualizar página automaticamente (opcional)
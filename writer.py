@@ -0,0 +1,183 @@
+"""
+Escritor único por processo com commit em grupo.
+
+Em vez de cada requisição abrir sua transação e fazer o próprio commit (um
+fsync por veículo), as escritas são enviadas para uma thread dedicada que
+junta o que chegar dentro de uma janela curta em uma só transação. Cada
+requisição espera o COMMIT do seu grupo antes de responder, então a
+confirmação continua durável. Cada tarefa roda em um SAVEPOINT próprio:
+se uma falhar, só ela é desfeita.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import db
+import metrics
+
+WRITE_BATCH_WINDOW = float(os.environ.get("WRITE_BATCH_WINDOW_MS", "2")) / 1000
+WRITE_BATCH_MAX = int(os.environ.get("WRITE_BATCH_MAX", "64"))
+WRITE_TIMEOUT = float(os.environ.get("WRITE_TIMEOUT", "15"))
+
+BATCH_SIZE = metrics.Histogram(
+    "portaria_write_batch_size", "Escritas agrupadas por commit", buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+COMMIT_DURATION = metrics.Histogram(
+    "portaria_write_commit_seconds", "Duração de cada transação de grupo (BEGIN até COMMIT)")
+QUEUE_WAIT = metrics.Histogram(
+    "portaria_write_queue_wait_seconds", "Tempo entre o envio da escrita e o início do seu grupo")
+metrics.REGISTRY.extend([BATCH_SIZE, COMMIT_DURATION, QUEUE_WAIT])
+
+
+class _WriterConnection:
+    """Conexão do escritor entregue às tarefas, com as instruções medidas"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def execute(self, sql, parameters=()):
+        inicio = time.perf_counter()
+        cursor = self._conn.execute(sql, parameters)
+        return db.TimedCursor(cursor, sql, time.perf_counter() - inicio)
+
+    def executemany(self, sql, seq_of_parameters):
+        inicio = time.perf_counter()
+        cursor = self._conn.executemany(sql, seq_of_parameters)
+        return db.TimedCursor(cursor, sql, time.perf_counter() - inicio)
+
+
+class GroupCommitWriter:
+    def __init__(self, database=None, window=WRITE_BATCH_WINDOW, max_batch=WRITE_BATCH_MAX):
+        self.database = database
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.writes = 0
+        self.failed_batches = 0
+
+    def _ensure_thread(self):
+        # A thread não sobrevive ao fork do gunicorn: cada worker inicia a sua
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._loop, name="db-writer", daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+        return self._queue
+
+    def submit(self, fn):
+        """Agenda ``fn(conn)`` no escritor; devolve um Future com o retorno"""
+        future = Future()
+        self._ensure_thread().put((fn, future, time.perf_counter()))
+        return future
+
+    def run(self, fn, timeout=WRITE_TIMEOUT):
+        """Executa ``fn(conn)`` no escritor e espera o commit do grupo"""
+        try:
+            return self.submit(fn).result(timeout=timeout)
+        except FutureTimeoutError:
+            raise TimeoutError(f"escrita não confirmada em {timeout:g}s (fila do escritor)") from None
+
+    def execute(self, sql, params=()):
+        """Uma instrução; devolve (lastrowid, rowcount) após o commit"""
+        def job(conn):
+            cursor = conn.execute(sql, params)
+            return cursor.lastrowid, cursor.rowcount
+        return self.run(job)
+
+    def _connect(self):
+        conn = db.connect(self.database)
+        conn.isolation_level = None
+        # Com o fsync dividido pelo grupo, dá para pagar a durabilidade total
+        conn.execute("PRAGMA synchronous = FULL")
+        return conn
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        limite = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            restante = limite - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=restante) if restante > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        conn = self._connect()
+        tarefa_conn = _WriterConnection(conn)
+        while True:
+            batch = self._next_batch()
+            inicio = time.perf_counter()
+            for _, _, enviado in batch:
+                QUEUE_WAIT.observe(inicio - enviado)
+            resultados = []
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for fn, future, _ in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    conn.execute("SAVEPOINT escrita")
+                    try:
+                        resultado = fn(tarefa_conn)
+                        conn.execute("RELEASE escrita")
+                        resultados.append((future, resultado, None))
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO escrita")
+                        conn.execute("RELEASE escrita")
+                        resultados.append((future, None, e))
+                conn.execute("COMMIT")
+            except Exception as e:
+                # Falha do grupo inteiro (banco travado, disco...): ninguém foi gravado
+                try:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                except Exception:
+                    conn.close()
+                    conn = self._connect()
+                    tarefa_conn = _WriterConnection(conn)
+                self.failed_batches += 1
+                # Inclui as que nem começaram (BEGIN falhou ou o erro veio no meio do
+                # grupo): do contrário o chamador esperaria WRITE_TIMEOUT à toa
+                for fn, future, _ in batch:
+                    if not future.done():
+                        try:
+                            future.set_exception(e)
+                        except InvalidStateError:
+                            pass
+                continue
+            finally:
+                COMMIT_DURATION.observe(time.perf_counter() - inicio)
+                BATCH_SIZE.observe(len(batch))
+                self.batches += 1
+
+            self.writes += len(resultados)
+            for future, resultado, erro in resultados:
+                if erro is None:
+                    future.set_result(resultado)
+                else:
+                    future.set_exception(erro)
+
+    def stats(self):
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "writes": self.writes,
+            "failed_batches": self.failed_batches,
+            "avg_batch": round(self.writes / self.batches, 3) if self.batches else 0.0,
+        }
+
+
+writer = GroupCommitWriter()